@@ -0,0 +1,99 @@
+"""Microbenchmark of normalise against the message reduction it replaced.
+
+The old reduction (see legacy_reduce) removed the punctuations with a
+translation table, lowered the characters one by one, and found the emojis with the regular expression of the
+emoji package before removing them one by one.
+
+Run from the repository root with:
+    python benchmarks/normalise_bench.py
+"""
+
+import os
+import string
+import sys
+import timeit
+
+# The resource paths of the bot are relative to the repository root:
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+import emoji
+
+import sanalkiwobot as skb
+
+
+def distinct_emojis(text):
+    """Return the distinct emojis in text, as emoji.distinct_emoji_lis did."""
+    
+    if hasattr(emoji, "distinct_emoji_lis"):
+        return emoji.distinct_emoji_lis(text)
+    
+    return list(set(emoji.get_emoji_regexp().findall(text)))
+
+
+def legacy_lower_tr(s):
+    """lower_tr before normalise, lowering the characters one by one."""
+    
+    r = ""
+    for i in s:
+        if i == "I":
+            r += "ı"
+        else:
+            r += i.lower()
+    
+    return r
+
+
+def legacy_reduce(text):
+    """The reduction of read_incoming before normalise, returning the words
+    and the emojis."""
+    
+    emojis = distinct_emojis(text)
+    
+    red_inc = legacy_lower_tr(
+        text.translate(str.maketrans("", "", string.punctuation))
+    )
+    for i in emojis:
+        red_inc = red_inc.replace(i, "")
+    
+    return red_inc.split() + emojis
+
+
+# Representative messages, by name:
+MESSAGES = {
+    "short ascii": "selam kiwo naber",
+    "short turkish": "Kıvo türkiye'de bugün kaç vaka var?",
+    "emojis": "merhabalar herkese 😀😀 nasılsınız 👋🏽 iyi akşamlar 🇹🇷!",
+    "uppercase": "KIWO ALMANYA VE İTALYA İÇİN CORONA SONUÇLARINI GÖSTER",
+    "long group": (
+        "arkadaşlar, bugün toplantıdan sonra ne yapıyoruz? 🤔 ben eve "
+        "gitmeyi düşünüyordum ama belki bir şeyler yeriz... 🍕🍔 "
+    ) * 25,
+}
+
+
+def bench(func, text):
+    """Return the best time of a call of func on text, in microseconds."""
+    
+    timer = timeit.Timer(lambda: func(text))
+    # Enough calls for at least 0.2 seconds:
+    number, _ = timer.autorange()
+    
+    return min(timer.repeat(repeat=5, number=number)) / number * 1e6
+
+
+def main():
+    print(f"{'message':<16}{'length':>8}{'old (us)':>12}{'new (us)':>12}"
+          f"{'speedup':>10}")
+    
+    for name, text in MESSAGES.items():
+        old = bench(legacy_reduce, text)
+        new = bench(skb.normalise, text)
+        
+        print(f"{name:<16}{len(text):>8}{old:>12.2f}{new:>12.2f}"
+              f"{old / new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
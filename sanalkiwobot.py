@@ -8,56 +8,453 @@ For a more detailed explanation, please see the readme file of the project.
 The bot runs until it receives a termination signal on the command line.
 """
 
+import asyncio
 import datetime as dt
+import hashlib
+import importlib
+import importlib.util
+import io
+import json
 import logging
 import os
-import shutil
+import pickle
+import re
+import signal
+import sqlite3
 import string
-from functools import wraps
+import zipfile
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache, wraps
+from queue import Queue
 from random import randint
+from threading import BoundedSemaphore, Condition, Event, Lock, Thread
+from time import monotonic, process_time, sleep, time
 from uuid import uuid4
 
-import emoji
-import pandas as pd
-import requests
-from telegram import Bot, ChatAction, TelegramError
+from telegram import Bot, ChatAction, Message, ReplyMarkup, TelegramError
+from telegram import Update
+from telegram.constants import MAX_MESSAGE_LENGTH
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+from telegram.error import Unauthorized
 from telegram.ext import Updater, CommandHandler, MessageHandler, Filters
-from telegram.ext import messagequeue as mq
+from telegram.ext import CallbackContext, Dispatcher, JobQueue
 from telegram.utils.request import Request
 
 
+class LazyModule:
+    """Stand-in for a module, which imports it when one of its attributes is
+    first used."""
+    
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        
+        return getattr(self._module, attr)
+
+
+# Modules imported only when they are first needed, as importing them takes
+#   most of the startup time (see StartupTimer). emoji is only needed when
+#   the startup snapshot is rebuilt (see StartupSnapshot).
+emoji = LazyModule("emoji")
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+requests = LazyModule("requests")
+
+# Only needed by the asyncio runtime (see AsyncRuntime), None if not installed:
+if importlib.util.find_spec("aiohttp") is None:
+    aiohttp = web = None
+else:
+    aiohttp = LazyModule("aiohttp")
+    web = LazyModule("aiohttp.web")
+
+
+class CallPromise:
+    """Result of a scheduled Bot API call (see OutboundScheduler and AsyncBot).
+    
+    done is set when the call is finished. Then, exception holds the raised
+    exception (None if the call succeeded) and result returns the result.
+    """
+    
+    def __init__(self, future):
+        self.done = Event()
+        self.exception = None
+        self._result = None
+        
+        future.add_done_callback(self._finish)
+    
+    def _finish(self, future):
+        if future.cancelled():
+            self.exception = TelegramError("Call cancelled")
+        elif future.exception() is not None:
+            self.exception = future.exception()
+        else:
+            self._result = future.result()
+        
+        self.done.set()
+    
+    def result(self, timeout=None):
+        self.done.wait(timeout=timeout)
+        
+        if self.exception is not None:
+            raise self.exception
+        
+        return self._result
+
+
+class TokenBucket:
+    """Rate limiter allowing bursts of up to 'burst' calls, refilled at 'rate'
+    calls per second. Not thread-safe, see OutboundScheduler."""
+    
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = monotonic()
+    
+    def _refill(self, now):
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.stamp) * self.rate
+        )
+        self.stamp = now
+    
+    def delay(self, now):
+        """Return the seconds to wait for a token."""
+        
+        self._refill(now)
+        
+        return max(0, (1 - self.tokens) / self.rate)
+    
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+    
+    def pause(self, now, seconds):
+        """Empty the bucket, such that the next token is available only after
+        the given seconds."""
+        
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+    
+    def full(self, now):
+        self._refill(now)
+        
+        return self.tokens >= self.burst
+
+
+class OutboundScheduler:
+    """Makes the outgoing Bot API calls of the bot within Telegram's limits.
+    
+    Calls are submitted with a chat ID and a priority class, and wait in a
+    queue of their chat. A single thread picks the next call to make: calls of
+    a higher priority class (e.g. replies to users) go ahead of the others
+    (e.g. a broadcast), and the chats of a class take turns. A call is made
+    only when a token is available in both the global bucket and the bucket
+    of its chat, if it is limited per chat. The picked calls are made on a
+    pool of sender threads, but at most one call per chat at a time, keeping
+    the calls of a chat in order.
+    
+    A call failing with flood control (RetryAfter) is put back to the front of
+    its queue, and its chat's bucket is paused for the time Telegram asks for.
+    The global bucket is paused instead if the call is not limited per chat,
+    and also if FLOOD_CHATS chats hit flood control within FLOOD_WINDOW
+    seconds, as then the limit of the bot is likely to be the one hit.
+    """
+    
+    # Priority classes, the lower the earlier:
+    INTERACTIVE = 0
+    BACKGROUND = 1
+    BROADCAST = 2
+    
+    # Number of retries after a flood limit error:
+    RETRIES = 3
+    
+    # Number of chats hitting flood control within FLOOD_WINDOW seconds to
+    #   pause all calls:
+    FLOOD_CHATS = 3
+    FLOOD_WINDOW = 1
+    
+    # Seconds between the removals of the buckets of inactive chats:
+    PRUNE_INTERVAL = 60
+    
+    def __init__(self, rate=29, private_rate=1, private_burst=3,
+                 group_rate=18 / 60, group_burst=1, senders=8):
+        self.private_rate = private_rate
+        self.private_burst = private_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.senders = senders
+        
+        self._global = TokenBucket(rate, rate)
+        self._buckets = dict()
+        # A queue for each priority class: chat ID -> deque of its calls, in
+        #   the order of the chats' turns:
+        self._queues = [OrderedDict() for i in range(self.BROADCAST + 1)]
+        # Chats with a call being made:
+        self._busy = set()
+        # Chat ID -> time of its last flood control error:
+        self._floods = dict()
+        self._cond = Condition()
+        self._running = True
+        self._last_prune = monotonic()
+        
+        self._executor = ThreadPoolExecutor(
+            senders, thread_name_prefix="sender"
+        )
+        self._thread = Thread(
+            target=self._run, name="outbound_scheduler", daemon=True
+        )
+        self._thread.start()
+    
+    def submit(self, func, chat_id, priority=INTERACTIVE, isgroup=None,
+               per_chat=True):
+        """Schedule func, a Bot API call to the chat, and return a
+        CallPromise of its result.
+        
+        If per_chat is True, the call is also limited by the chat's bucket,
+        whose rate depends on isgroup.
+        """
+        
+        # NOTE: The default isgroup relies on the negative chat ID property of
+        #   groups. Keep in mind that this property is not officially defined
+        #   and may be subject to change.
+        if isgroup is None:
+            isgroup = chat_id < 0
+        
+        future = Future()
+        call = [func, chat_id, priority, per_chat, future, 0]
+        
+        with self._cond:
+            if per_chat and chat_id not in self._buckets:
+                self._buckets[chat_id] = TokenBucket(
+                    self.group_rate, self.group_burst
+                ) if isgroup else TokenBucket(
+                    self.private_rate, self.private_burst
+                )
+            
+            self._queues[priority].setdefault(chat_id, deque()).append(call)
+            self._cond.notify()
+        
+        return CallPromise(future)
+    
+    def _pick(self, now):
+        # Return the next call to make (or None) and the seconds to wait for
+        #   one otherwise (None if there are none). Called with the lock held.
+        wait = self._global.delay(now)
+        
+        if wait > 0:
+            return None, wait
+        
+        wait = None
+        
+        for queues in self._queues:
+            for chat_id, calls in queues.items():
+                if chat_id in self._busy:
+                    continue
+                
+                call = calls[0]
+                
+                if call[3]:
+                    delay = self._buckets[chat_id].delay(now)
+                    
+                    if delay > 0:
+                        wait = delay if wait is None else min(wait, delay)
+                        continue
+                    
+                    self._buckets[chat_id].take(now)
+                
+                calls.popleft()
+                
+                # Give the turn to the other chats:
+                if calls:
+                    queues.move_to_end(chat_id)
+                else:
+                    del queues[chat_id]
+                
+                self._global.take(now)
+                
+                return call, None
+        
+        return None, wait
+    
+    def _prune(self, now):
+        # Forget the buckets of the chats which have been idle long enough
+        #   to fill them. Called with the lock held.
+        queued = set()
+        for queues in self._queues:
+            queued.update(queues)
+        
+        for chat_id in [
+            k for k, v in self._buckets.items()
+            if k not in queued and k not in self._busy and v.full(now)
+        ]:
+            del self._buckets[chat_id]
+        
+        self._last_prune = now
+    
+    def _run(self):
+        with self._cond:
+            while self._running:
+                now = monotonic()
+                
+                if now - self._last_prune >= self.PRUNE_INTERVAL:
+                    self._prune(now)
+                
+                call, wait = self._pick(now)
+                
+                if call is None:
+                    self._cond.wait(wait)
+                    continue
+                
+                self._busy.add(call[1])
+                self._executor.submit(self._make, call)
+    
+    def _make(self, call):
+        func, chat_id, priority, per_chat, future, tries = call
+        retry_after = None
+        
+        try:
+            result = func()
+        except RetryAfter as e:
+            if tries < self.RETRIES:
+                retry_after = e.retry_after
+            else:
+                future.set_exception(e)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        
+        with self._cond:
+            self._busy.discard(chat_id)
+            
+            if retry_after is not None:
+                logger.warning(
+                    f"Flood limit hit for chat {chat_id}, retrying in"
+                    f" {retry_after} sec.s."
+                )
+                
+                now = monotonic()
+                
+                if per_chat and chat_id in self._buckets:
+                    self._buckets[chat_id].pause(now, retry_after)
+                    
+                    self._floods[chat_id] = now
+                    for k in [
+                        k for k, v in self._floods.items()
+                        if now - v > self.FLOOD_WINDOW
+                    ]:
+                        del self._floods[k]
+                    
+                    if len(self._floods) >= self.FLOOD_CHATS:
+                        logger.warning(
+                            f"Flood limit hit for {len(self._floods)} chats,"
+                            f" pausing all calls for {retry_after} sec.s."
+                        )
+                        self._global.pause(now, retry_after)
+                else:
+                    self._global.pause(now, retry_after)
+                
+                call[5] += 1
+                queues = self._queues[priority]
+                queues.setdefault(chat_id, deque()).appendleft(call)
+            
+            self._cond.notify()
+    
+    def stop(self):
+        """Stop making calls. The calls being made are finished, the queued
+        ones are abandoned."""
+        
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+
 class SanalkiwoBot(Bot):
-    """Bot subclass for decorating some of its methods.
+    """Bot subclass sending its outgoing calls through an OutboundScheduler.
+    
+    send_message, send_document, send_chat_action and delete_message schedule
+    the call and return a CallPromise at once, in order to avoid flood limits.
+    They accept the optional arg.s:
     
-    MessageQueue is used to decorate the send_message method, in order to avoid
-    flood limits.
+    queued: If False, make the call right away and return its result.
+    isgroup: Whether the chat is a group, guessed from the chat ID if None.
+    priority: Priority class of the call, OutboundScheduler.INTERACTIVE by
+        default.
     """
     
-    def __init__(self, *args, queue_msgs=True, msg_queue=None, **kwargs):
+    def __init__(self, *args, scheduler=None, **kwargs):
         super(SanalkiwoBot, self).__init__(*args, **kwargs)
         
-        # Attributes for the MessageQueue decorator:
-        self._is_messages_queued_default = queue_msgs
-        self._msg_queue = msg_queue or mq.MessageQueue()
+        self._scheduler = scheduler or OutboundScheduler()
     
     def stop(self):
         try:
-            self._msg_queue.stop()
+            self._scheduler.stop()
         except:
             logger.warning(
-                "MessageQueue.stop() failed while stopping SanalkiwoBot!"
+                "OutboundScheduler.stop() failed while stopping SanalkiwoBot!"
             )
     
-    # Note that the wrapped versions below can now accept the decorator's
-    #   'queued' and 'isgroup' optional arg.s. 'queued' defaults to True and
-    #   'isgroup' defaults to False.
+    def _schedule(self, func, chat_id, queued, isgroup, priority,
+                  per_chat=True):
+        if not queued:
+            return func()
+        
+        return self._scheduler.submit(
+            func, chat_id, priority, isgroup, per_chat
+        )
+    
+    def send_message(self, chat_id, *args, queued=True, isgroup=None,
+                     priority=OutboundScheduler.INTERACTIVE, **kwargs):
+        return self._schedule(
+            lambda: super(SanalkiwoBot, self).send_message(
+                chat_id, *args, **kwargs
+            ),
+            chat_id, queued, isgroup, priority
+        )
     
-    @mq.queuedmessage
-    def send_message(self, *args, **kwargs):
-        return super(SanalkiwoBot, self).send_message(*args, **kwargs)
+    def send_document(self, chat_id, document, *args, queued=True,
+                      isgroup=None, priority=OutboundScheduler.INTERACTIVE,
+                      **kwargs):
+        def call():
+            # Upload from the beginning again when retried:
+            if hasattr(document, "seek"):
+                document.seek(0)
+            
+            return super(SanalkiwoBot, self).send_document(
+                chat_id, document, *args, **kwargs
+            )
+        
+        return self._schedule(call, chat_id, queued, isgroup, priority)
+    
+    # (Deletions count towards the limits of a chat as well, so that revoking
+    #   an announcement does not flood a group.)
+    def delete_message(self, chat_id, *args, queued=True, isgroup=None,
+                       priority=OutboundScheduler.INTERACTIVE, **kwargs):
+        return self._schedule(
+            lambda: super(SanalkiwoBot, self).delete_message(
+                chat_id, *args, **kwargs
+            ),
+            chat_id, queued, isgroup, priority
+        )
     
-    # If necessary, also wrap other send_* methods here.
-    # NOTE: Wrapping send_document breaks db_backup. (FIXME?)
+    # Chat actions do not count towards the limits of a chat:
+    def send_chat_action(self, chat_id, *args, queued=True, isgroup=None,
+                         priority=OutboundScheduler.INTERACTIVE, **kwargs):
+        return self._schedule(
+            lambda: super(SanalkiwoBot, self).send_chat_action(
+                chat_id, *args, **kwargs
+            ),
+            chat_id, queued, isgroup, priority, per_chat=False
+        )
 
 
 class UpdaterBotStop(Updater):
@@ -72,6 +469,2523 @@ class UpdaterBotStop(Updater):
         self.bot.stop()
 
 
+class OrderedDispatcher(Dispatcher):
+    """Dispatcher subclass which handles the updates of different chats
+    concurrently, while keeping the updates of a chat in order.
+    
+    Each chat has a queue of its pending updates, which is drained by one of
+    the worker threads at a time. Thus, a slow handler (e.g. corona waiting
+    for a download) only delays the later updates of its own chat, and the
+    steps of an interactive process (e.g. announce_lv1 and announce_lv2) are
+    never reordered. Updates without a chat are queued together.
+    
+    At most max_pending updates wait or run at once. After that, the
+    dispatcher thread blocks until an update is done, leaving the rest in the
+    update queue.
+    """
+    
+    def __init__(self, *args, chat_workers=8, max_pending=256, **kwargs):
+        super().__init__(*args, **kwargs)
+        
+        self.chat_workers = chat_workers
+        self._executor = ThreadPoolExecutor(
+            chat_workers, thread_name_prefix="chat_worker"
+        )
+        self._slots = BoundedSemaphore(max_pending)
+        # Chat ID -> deque of its updates, the first one being processed:
+        self._queues = dict()
+        self._queues_lock = Lock()
+    
+    @staticmethod
+    def _chat_key(update):
+        if isinstance(update, Update) and update.effective_chat is not None:
+            return update.effective_chat.id
+        
+        return None
+    
+    def process_update(self, update):
+        key = self._chat_key(update)
+        
+        self._slots.acquire()
+        
+        with self._queues_lock:
+            queue = self._queues.get(key)
+            
+            if queue is not None:
+                # A worker is already draining the chat's queue
+                queue.append(update)
+                return
+            
+            queue = self._queues[key] = deque([update])
+        
+        self._executor.submit(self._drain, key, queue)
+    
+    def _drain(self, key, queue):
+        while True:
+            try:
+                super().process_update(queue[0])
+            except Exception:
+                logger.exception(f"Uncaught error while dispatching: {key}")
+            finally:
+                self._slots.release()
+            
+            with self._queues_lock:
+                queue.popleft()
+                
+                if not queue:
+                    del self._queues[key]
+                    return
+    
+    def stop(self):
+        super().stop()
+        
+        # Finish the updates already taken from the update queue:
+        self._executor.shutdown(wait=True)
+
+
+class AsyncBot(Bot):
+    """Bot subclass whose outgoing calls are made on an asyncio event loop.
+    
+    send_message, send_document, send_chat_action and delete_message schedule
+    their Bot API request on the loop and return a CallPromise at once, like
+    the scheduled methods of SanalkiwoBot. They also accept the 'queued',
+    'isgroup' and 'priority' arg.s of those methods, but ignore the priority.
+    
+    Queued calls are throttled to 29 messages per second in total and 19 per
+    minute in groups. At most
+    max_in_flight requests are made at once, and a request hitting the flood
+    limit is retried after the time Telegram asks for.
+    
+    The other Bot methods are not changed, they block as usual.
+    """
+    
+    # Number of retries after a flood limit error:
+    RETRIES = 3
+    
+    # Intervals between queued messages, in total and in groups:
+    INTERVAL_ALL = 1 / 29
+    INTERVAL_GROUP = 60 / 19
+    
+    def __init__(self, token, loop, max_in_flight=1000, **kwargs):
+        super(AsyncBot, self).__init__(token, **kwargs)
+        
+        self.loop = loop
+        self.max_in_flight = max_in_flight
+        # Loop times for the next queued messages, in total and in groups:
+        self._next_slot = {"all": 0, "group": 0}
+        # Made on the loop by the first call:
+        self._session = None
+        self._slots = None
+    
+    @staticmethod
+    def _error(status, payload):
+        description = payload.get("description", "Unknown error")
+        parameters = payload.get("parameters") or dict()
+        
+        if "retry_after" in parameters:
+            return RetryAfter(parameters["retry_after"])
+        if status in {401, 403}:
+            return Unauthorized(description)
+        if status == 400:
+            return BadRequest(description)
+        
+        return NetworkError(description)
+    
+    async def call(self, method, params=None, files=None, timeout=30):
+        """Make a Bot API request on the loop and return its result. Raise the
+        TelegramError matching the failure otherwise.
+        
+        files maps field names to (file name, bytes) tuples to upload.
+        """
+        
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        
+        url = f"{self.base_url}/{method}"
+        params = {k: v for k, v in (params or dict()).items() if v is not None}
+        
+        for attempt in range(self.RETRIES + 1):
+            if files:
+                # (A FormData can not be sent twice, make it on each attempt)
+                data = aiohttp.FormData()
+                for k, v in params.items():
+                    data.add_field(k, str(v))
+                for k, (name, content) in files.items():
+                    data.add_field(k, content, filename=name)
+                kwargs = {"data": data}
+            else:
+                kwargs = {"json": params}
+            
+            try:
+                async with self._slots:
+                    async with self._session.post(
+                        url,
+                        timeout=aiohttp.ClientTimeout(total=timeout),
+                        **kwargs
+                    ) as resp:
+                        status = resp.status
+                        payload = await resp.json(content_type=None)
+            except asyncio.TimeoutError:
+                raise TimedOut()
+            except (aiohttp.ClientError, ValueError) as e:
+                raise NetworkError(f"{method} failed: {e}")
+            
+            if payload.get("ok"):
+                return payload["result"]
+            
+            exc = self._error(status, payload)
+            
+            if isinstance(exc, RetryAfter) and attempt < self.RETRIES:
+                logger.warning(
+                    f"Flood limit hit on {method}, retrying in"
+                    f" {exc.retry_after} sec.s."
+                )
+                await asyncio.sleep(exc.retry_after)
+            else:
+                raise exc
+    
+    def _throttle_delay(self, isgroup):
+        # Reserve the next free slots, must be called on the loop.
+        now = self.loop.time()
+        delay = 0
+        
+        for kind, interval in (("all", self.INTERVAL_ALL),
+                               ("group", self.INTERVAL_GROUP)):
+            if kind == "group" and not isgroup:
+                continue
+            
+            slot = max(now, self._next_slot[kind])
+            self._next_slot[kind] = slot + interval
+            delay = max(delay, slot - now)
+        
+        return delay
+    
+    def _submit(self, method, params, files=None, queued=True, isgroup=None,
+                timeout=None):
+        # NOTE: The default isgroup relies on the negative chat ID property of
+        #   groups, as in OutboundScheduler.submit.
+        if isgroup is None:
+            isgroup = params["chat_id"] < 0
+        
+        async def run():
+            if queued:
+                await asyncio.sleep(self._throttle_delay(isgroup))
+            
+            try:
+                result = await self.call(method, params, files, timeout or 30)
+            except TelegramError as e:
+                logger.warning(f"{method} to chat {params['chat_id']}: {e}")
+                raise
+            
+            return Message.de_json(result, self) \
+                if isinstance(result, dict) else result
+        
+        return CallPromise(asyncio.run_coroutine_threadsafe(run(), self.loop))
+    
+    @staticmethod
+    def _params(chat_id, kwargs):
+        params = {"chat_id": chat_id}
+        
+        for k, v in kwargs.items():
+            params[k] = v.to_json() if isinstance(v, ReplyMarkup) else v
+        
+        return params
+    
+    def send_message(self, chat_id, text, queued=True, isgroup=None,
+                     priority=None, timeout=None, **kwargs):
+        params = self._params(chat_id, kwargs)
+        params["text"] = text
+        
+        return self._submit("sendMessage", params, None, queued, isgroup,
+                            timeout)
+    
+    def delete_message(self, chat_id, message_id, queued=True, isgroup=None,
+                       priority=None, timeout=None, **kwargs):
+        params = self._params(chat_id, kwargs)
+        params["message_id"] = message_id
+        
+        return self._submit("deleteMessage", params, None, queued, isgroup,
+                            timeout)
+    
+    def send_chat_action(self, chat_id, action, queued=True, isgroup=None,
+                         priority=None, timeout=None, **kwargs):
+        params = self._params(chat_id, kwargs)
+        params["action"] = action
+        
+        # Not queued, chat actions are not limited like the messages:
+        return self._submit("sendChatAction", params, None, False, False,
+                            timeout)
+    
+    def send_document(self, chat_id, document, filename=None, queued=True,
+                      isgroup=None, priority=None, timeout=None, **kwargs):
+        content = document.read() if hasattr(document, "read") else document
+        files = {"document": (filename or "document", content)}
+        
+        return self._submit("sendDocument", self._params(chat_id, kwargs),
+                            files, True, isgroup, timeout)
+    
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+class AsyncRuntime:
+    """Runs the bot on a single asyncio event loop, instead of an Updater.
+    
+    Updates are received by long polling (or by a webhook server, see run) and
+    handed to a Dispatcher on the loop in the order they arrive. The handlers
+    do not get threads of their own: the calls they make through the AsyncBot
+    do not block, so a single process can have thousands of them in flight.
+    The parts of the handlers which may block (e.g. the COVID downloads of
+    corona) are run on the loop's default executor, see run_blocking.
+    
+    The runtime is also the job queue of its Dispatcher, providing run_once
+    and run_repeating. The jobs are timed by the loop, but run one at a time
+    on a single job thread (like the ones of JobQueue), since they are allowed
+    to block (e.g. covid_prefetch waits for its downloads).
+    """
+    
+    Job = namedtuple("Job", ["callback", "context", "name"])
+    
+    # Long polling timeout of getUpdates, and the seconds to wait after a
+    #   failed getUpdates:
+    POLL_TIMEOUT = 30
+    POLL_RETRY = 5
+    
+    def __init__(self, bot):
+        self.bot = bot
+        self.loop = bot.loop
+        self.dispatcher = Dispatcher(
+            bot, None, job_queue=self, use_context=True
+        )
+        self._jobs = ThreadPoolExecutor(1, thread_name_prefix="job")
+        self._stopping = False
+    
+    @staticmethod
+    def _seconds(t):
+        return t.total_seconds() if isinstance(t, dt.timedelta) else t
+    
+    def _schedule(self, job, delay, interval=None):
+        def fire():
+            if self._stopping:
+                return
+            
+            self._jobs.submit(self._run_job, job)
+            
+            if interval is not None:
+                self.loop.call_later(interval, fire)
+        
+        # May be called from the job thread as well:
+        self.loop.call_soon_threadsafe(self.loop.call_later, delay, fire)
+        
+        return job
+    
+    def _run_job(self, job):
+        try:
+            job.callback(CallbackContext.from_job(job, self.dispatcher))
+        except Exception as e:
+            self.dispatcher.dispatch_error(None, e)
+    
+    def run_once(self, callback, when, context=None, name=None):
+        job = self.Job(callback, context, name or callback.__name__)
+        return self._schedule(job, self._seconds(when))
+    
+    def run_repeating(self, callback, interval, first=None, context=None,
+                      name=None):
+        job = self.Job(callback, context, name or callback.__name__)
+        interval = self._seconds(interval)
+        first = interval if first is None else self._seconds(first)
+        
+        return self._schedule(job, first, interval)
+    
+    def _dispatch(self, data):
+        self.dispatcher.process_update(Update.de_json(data, self.bot))
+    
+    async def _poll(self):
+        offset = 0
+        
+        while True:
+            try:
+                updates = await self.bot.call(
+                    "getUpdates",
+                    {"offset": offset, "timeout": self.POLL_TIMEOUT},
+                    timeout=self.POLL_TIMEOUT + 10
+                )
+            except TelegramError as e:
+                logger.warning(f"getUpdates failed: {e}")
+                await asyncio.sleep(self.POLL_RETRY)
+                continue
+            
+            for i in updates:
+                offset = i["update_id"] + 1
+                self._dispatch(i)
+    
+    async def _webhook(self, request):
+        self._dispatch(await request.json())
+        
+        return web.Response()
+    
+    async def _main(self, stop, webhook_url, url_path, port):
+        if webhook_url is None:
+            await self.bot.call("deleteWebhook")
+            poller = self.loop.create_task(self._poll())
+        else:
+            app = web.Application()
+            app.router.add_post("/" + url_path, self._webhook)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, "0.0.0.0", port).start()
+            await self.bot.call("setWebhook", {"url": webhook_url})
+        
+        logger.info("Waiting for input...")
+        
+        await stop.wait()
+        
+        logger.info("Stopping the asyncio runtime...")
+        
+        self._stopping = True
+        
+        if webhook_url is None:
+            poller.cancel()
+        else:
+            await runner.cleanup()
+        
+        # Let the running job finish, it may be waiting for calls on the loop:
+        await self.loop.run_in_executor(None, self._jobs.shutdown)
+        
+        # The calls still in flight (e.g. of an interrupted broadcast, which
+        #   is resumed on the next start) are abandoned, like the ones left in
+        #   an OutboundScheduler:
+        pending = [
+            i for i in asyncio.all_tasks(self.loop)
+            if i is not asyncio.current_task(self.loop) and not i.done()
+        ]
+        
+        if pending:
+            logger.warning(f"Abandoning {len(pending)} calls in flight.")
+        else:
+            await self.bot.close()
+    
+    def run(self, webhook_url=None, url_path="", port=None):
+        """Run the bot until the process receives SIGINT or SIGTERM.
+        
+        If webhook_url is given, serve the updates sent to it on the given
+        port and URL path instead of polling.
+        """
+        
+        asyncio.set_event_loop(self.loop)
+        stop = asyncio.Event()
+        
+        for i in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(i, stop.set)
+        
+        try:
+            self.loop.run_until_complete(
+                self._main(stop, webhook_url, url_path, port)
+            )
+        finally:
+            self.loop.close()
+
+
+# A message text reduced by normalise:
+NormalisedText = namedtuple(
+    "NormalisedText", ["text", "words", "candidates", "emojis"]
+)
+
+
+class PhraseMatcher:
+    """Word-level Aho-Corasick automaton for detecting keyword phrases.
+    
+    Phrases are added as space separated strings, each with a label (e.g. the
+    name of the word set it comes from) and an optional value. After compile
+    is called, scan walks a list of words once and reports every occurence of
+    every added phrase, regardless of the message length.
+    """
+    
+    def __init__(self):
+        # Node 0 is the root. For every node: the transitions on words, the
+        #   failure link and the (label, word count, value) outputs.
+        self._goto = [dict()]
+        self._fail = [0]
+        self._out = [list()]
+        self._compiled = False
+    
+    def add(self, phrase, label, value=None):
+        """Add a phrase to the automaton. value defaults to the phrase."""
+        
+        words = phrase.split()
+        
+        if not words:
+            return
+        
+        node = 0
+        for w in words:
+            nxt = self._goto[node].get(w)
+            
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][w] = nxt
+                self._goto.append(dict())
+                self._fail.append(0)
+                self._out.append(list())
+            
+            node = nxt
+        
+        entry = (label, len(words), phrase if value is None else value)
+        if entry not in self._out[node]:
+            self._out[node].append(entry)
+        
+        self._compiled = False
+    
+    def words(self):
+        """Return the set of the words in the added phrases."""
+        
+        return set().union(*self._goto)
+    
+    def compile(self):
+        """Compute the failure links. Must be called after the last add."""
+        
+        queue = list(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+        
+        # Breadth-first traversal, so the failure link of a node's parent is
+        #   always computed before the node itself:
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            
+            for w, nxt in self._goto[node].items():
+                queue.append(nxt)
+                
+                f = self._fail[node]
+                while f and w not in self._goto[f]:
+                    f = self._fail[f]
+                
+                self._fail[nxt] = self._goto[f].get(w, 0)
+                self._out[nxt] = self._out[nxt] + [
+                    i for i in self._out[self._fail[nxt]]
+                    if i not in self._out[nxt]
+                ]
+        
+        self._compiled = True
+    
+    def scan(self, words):
+        """Return a MatchResult holding every phrase occurence in words.
+        
+        An element of words can also be a tuple of alternative forms of the
+        word (see normalise), then the phrases with any of them are found.
+        """
+        
+        if not self._compiled:
+            self.compile()
+        
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        
+        hits = []
+        node = 0
+        # Nodes reached through the alternative forms, if there are any:
+        nodes = None
+        
+        for end, w in enumerate(words, start=1):
+            if nodes is None and type(w) is str:
+                while node and w not in goto[node]:
+                    node = fail[node]
+                
+                node = goto[node].get(w, 0)
+                
+                for label, length, value in out[node]:
+                    hits.append((end - length, end, label, value))
+                
+                continue
+            
+            reached = set()
+            for n in nodes or (node,):
+                for form in ((w,) if type(w) is str else w):
+                    m = n
+                    while m and form not in goto[m]:
+                        m = fail[m]
+                    
+                    reached.add(goto[m].get(form, 0))
+            
+            found = list()
+            for n in reached:
+                for label, length, value in out[n]:
+                    if (label, length, value) not in found:
+                        found.append((label, length, value))
+                        hits.append((end - length, end, label, value))
+            
+            # Back to a single node once the alternatives lead to the same one:
+            if len(reached) == 1:
+                node = reached.pop()
+                nodes = None
+            else:
+                nodes = reached
+        
+        return MatchResult(hits)
+
+
+class MatchResult:
+    """Phrase occurences found by PhraseMatcher.scan.
+    
+    Each hit is a (start, end, label, value) tuple, where start and end are
+    the word indices of the phrase in the scanned list (end is exclusive).
+    """
+    
+    def __init__(self, hits):
+        self.hits = hits
+        self.labels = {i[2] for i in hits}
+    
+    def __contains__(self, label):
+        return label in self.labels
+    
+    def values(self, label):
+        """Return the values of the hits with the given label, in order."""
+        
+        return [i[3] for i in self.hits if i[2] == label]
+    
+    def covered(self, labels):
+        """Return the set of word indices covered by hits of given labels."""
+        
+        r = set()
+        for start, end, label, _ in self.hits:
+            if label in labels:
+                r.update(range(start, end))
+        
+        return r
+
+
+class TurkishStemmer:
+    """Strips the Turkish suffixes off words, guided by a vocabulary.
+    
+    A suffix is stripped only if it would be attached to the rest of the word
+    in the same form, so that it agrees with the vowel harmony and the
+    consonant of the stem (e.g. "türkiye" takes "de" and "ye", "ırak" takes
+    "ta" and "a"). Suffixes are given as templates, where:
+        "A": "a" after a back vowel, "e" after a front vowel
+        "I": "ı", "i", "u" or "ü", whichever fits the last vowel
+        "D": "t" after a hard consonant, "d" otherwise
+        "C": "ç" after a hard consonant, "c" otherwise
+    and other letters are taken as they are. (See get_preposition for the
+    "de/da" case.)
+    
+    A word is stemmed to itself if it is in the vocabulary, otherwise to the
+    longest of the given stems which can be reached by stripping suffixes one
+    after another. Only the vocabulary words which can take suffixes should
+    be given as stems (e.g. not "misin"), and the ones shorter than MIN_STEM
+    are never reached, as short words (e.g. "sa", "at") are the endings of
+    too many others. Stripping stops at a vocabulary word, so a word which
+    only looks like a suffixed stem (e.g. "maliye") can be kept as it is by
+    adding it to both. Unknown words are left as they are. Results are
+    memoised, so a word seen before is stemmed with a single lookup.
+    """
+    
+    # (Template, what the stem must end with: "vowel", "consonant" or None
+    #   for both) pairs of the suffixes, nominal ones first:
+    SUFFIXES = [
+        ("lAr", None), ("lArI", None),  # Plural
+        ("DA", None), ("DAn", None), ("nDA", "vowel"), ("nDAn", "vowel"),
+        ("yA", "vowel"), ("A", "consonant"), ("nA", "vowel"),
+        ("yI", "vowel"), ("I", "consonant"), ("nI", "vowel"),
+        ("nIn", "vowel"), ("In", "consonant"),
+        ("ylA", "vowel"), ("lA", "consonant"), ("CA", None), ("ki", None),
+        ("m", "vowel"), ("Im", "consonant"),  # Possessive
+        ("mIz", "vowel"), ("ImIz", "consonant"),
+        ("nIz", "vowel"), ("InIz", "consonant"), ("sI", "vowel"),
+        ("CIm", None), ("CIğIm", None), ("CIk", None),  # Endearment
+        ("DIr", None), ("sIn", None), ("sInIz", None),  # Predicative
+        ("Ar", "consonant"), ("Ir", "consonant"), ("r", "vowel"),  # Verbal
+        ("mIş", None), ("sAnA", None)
+    ]
+    
+    # Stems shorter than this are not stripped further:
+    MIN_STEM = 4
+    
+    def __init__(self, vocabulary, stems=None, memo_size=65536):
+        self.vocabulary = set(vocabulary)
+        self.stems = {
+            i for i in (self.vocabulary if stems is None else stems)
+            if len(i) >= self.MIN_STEM
+        }
+        
+        # Templates by every surface form they can take, to find the ones a
+        #   word can end with:
+        self._templates = dict()
+        for template, after in self.SUFFIXES:
+            for form in self._forms(template):
+                self._templates.setdefault(form, []).append((template, after))
+        
+        self._longest = max(len(i) for i in self._templates)
+        self._memo_size = memo_size
+        self.stem = lru_cache(maxsize=memo_size)(self._stem)
+    
+    def __getstate__(self):
+        # The memoised stem can not be pickled (see StartupSnapshot), it is
+        #   made again by __setstate__:
+        state = self.__dict__.copy()
+        del state["stem"]
+        
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.stem = lru_cache(maxsize=self._memo_size)(self._stem)
+    
+    @staticmethod
+    def _forms(template):
+        """Return every surface form of a suffix template."""
+        
+        forms = [""]
+        for i in template:
+            letters = {"A": "ae", "I": "ıiuü", "D": "dt", "C": "cç"}.get(i, i)
+            forms = [j + k for j in forms for k in letters]
+        
+        return forms
+    
+    @staticmethod
+    def attach(stem, template):
+        """Return the form of the suffix template attached to stem."""
+        
+        r = ""
+        last = stem[-1:]
+        vowel = next((i for i in reversed(stem) if i in VOWELS), "a")
+        
+        for i in template:
+            if i == "A":
+                i = "a" if vowel in BACK_VOWELS else "e"
+            elif i == "I":
+                i = {"a": "ı", "ı": "ı", "o": "u", "u": "u",
+                     "e": "i", "i": "i", "ö": "ü", "ü": "ü"}[vowel]
+            elif i == "D":
+                i = "t" if last in HARD_CONSONANTS else "d"
+            elif i == "C":
+                i = "ç" if last in HARD_CONSONANTS else "c"
+            
+            r += i
+            last = i
+            
+            if i in VOWELS:
+                vowel = i
+        
+        return r
+    
+    def _strip(self, word):
+        """Return the stems of word reachable by stripping one suffix."""
+        
+        r = []
+        
+        for n in range(1, min(self._longest, len(word) - self.MIN_STEM) + 1):
+            for template, after in self._templates.get(word[-n:], ()):
+                stem = word[:-n]
+                
+                if after is not None and \
+                        (stem[-1] in VOWELS) != (after == "vowel"):
+                    continue
+                
+                if self.attach(stem, template) == word[-n:]:
+                    r.append(stem)
+        
+        return r
+    
+    def _stem(self, word):
+        if word in self.vocabulary:
+            return word
+        
+        # Every stem of the word, by stripping suffixes one after another
+        #   until a vocabulary word is reached:
+        stems = set()
+        queue = [word]
+        while queue:
+            for i in self._strip(queue.pop()):
+                if i not in stems:
+                    stems.add(i)
+                    
+                    if i not in self.vocabulary:
+                        queue.append(i)
+        
+        known = [i for i in stems if i in self.stems]
+        
+        return max(known, key=len) if known else word
+    
+    def stem_all(self, words):
+        """Stem every word in a list. A tuple of alternative forms (see
+        normalise) is stemmed to a tuple of their distinct stems."""
+        
+        r = []
+        
+        for w in words:
+            if type(w) is str:
+                r.append(self.stem(w))
+            else:
+                stems = tuple(dict.fromkeys(self.stem(i) for i in w))
+                r.append(stems if len(stems) > 1 else stems[0])
+        
+        return r
+
+
+class MessageFilter:
+    """Cheap check of whether a message may need a reply, before it is
+    reduced and scanned for keywords.
+    
+    A message passes if the stem (see TurkishStemmer) of any word in it is
+    one of the given words, in either lowercase form of 'I' (see normalise).
+    The words are split at anything other than a letter or a digit (e.g.
+    emojis) after the punctuations are removed, as in normalise. This can let
+    some messages through needlessly, but never drops one that the full
+    keyword scan would find a word in. The messages are counted, to see how
+    much of the traffic is filtered out.
+    """
+    
+    WORD_PATTERN = re.compile(r"\w+")
+    
+    def __init__(self, words, stemmer):
+        # Only the first word of a phrase is needed for it to occur:
+        self._words = {stemmer.stem(i.split()[0]) for i in words if i.split()}
+        self.stemmer = stemmer
+        
+        self.passed = 0
+        self.dropped = 0
+        self._lock = Lock()
+    
+    def passes(self, text):
+        """Return whether the message text may have any of the words."""
+        
+        text = PUNCTUATION_PATTERN.sub("", text)
+        words = self.WORD_PATTERN.findall(lower_tr(text))
+        
+        if "I" in text:
+            words += self.WORD_PATTERN.findall(lower_tr(text.replace("I", "i")))
+        
+        found = not self._words.isdisjoint(map(self.stemmer.stem, words))
+        
+        with self._lock:
+            if found:
+                self.passed += 1
+            else:
+                self.dropped += 1
+        
+        return found
+    
+    def skip(self):
+        """Count a message which was let through without being checked."""
+        
+        with self._lock:
+            self.passed += 1
+    
+    def report(self):
+        """Return a line about the counts, for the logs."""
+        
+        with self._lock:
+            total = self.passed + self.dropped
+            ratio = self.dropped / total if total else 0
+            
+            return f"{self.dropped} of {total} messages ({ratio:.0%}) took" \
+                " the fast path."
+
+
+class LocationIndex:
+    """Lookup table for the location names in a DICT_LOCATIONS-like dict.
+    
+    Every surface form of a location (its Turkish names, its English name in
+    lowercase and their suffixed forms) is mapped to the canonical (English)
+    name used in the COVID datasheets. The first Turkish name of a canonical
+    name in the dict is used as its display name.
+    
+    Misspelled names can be looked up with closest, through an index of the
+    character trigrams of the names (not including the suffixed forms).
+    """
+    
+    # Endings accepted after a location name in addition to the "de/da" form
+    #   made by get_preposition:
+    SUFFIXES = ["da", "de", "ın", "in", "nde", "nın", "nin"]
+    
+    # Trigram similarity of a misspelled name to the closest name, for it to
+    #   be taken as that name, or suggested to the user:
+    FUZZY_ACCEPT = 0.5
+    FUZZY_SUGGEST = 0.3
+    
+    # Shorter words are not looked up with closest, as any name is only a
+    #   letter or two away from them:
+    FUZZY_MIN_LENGTH = 4
+    
+    def __init__(self, dictn):
+        self._forms = dict()
+        self._display = dict()
+        
+        names = []
+        for key, val in dictn.items():
+            if val not in self._display:
+                self._display[val] = key
+            
+            names.append((key, val))
+            names.append((lower_tr(val), val))
+        
+        # Add the names themselves first, so that a suffixed form never
+        #   shadows another location's name:
+        for name, val in names:
+            self._forms.setdefault(name, val)
+        
+        for name, val in names:
+            self._forms.setdefault(get_preposition(name, apos=False), val)
+            
+            for i in self.SUFFIXES:
+                self._forms.setdefault(name + i, val)
+        
+        # Names and the indices of the names having each trigram:
+        self._names = list(dict.fromkeys(names))
+        self._name_trigrams = [self.trigrams(i) for i, _ in self._names]
+        self._trigram_index = dict()
+        
+        for n, grams in enumerate(self._name_trigrams):
+            for i in grams:
+                self._trigram_index.setdefault(i, []).append(n)
+    
+    @staticmethod
+    def trigrams(s):
+        """Return the set of the character trigrams of s, padded so that the
+        beginning of s counts more than its end."""
+        
+        s = "  " + s + " "
+        
+        return {s[i:i + 3] for i in range(len(s) - 2)}
+    
+    def __contains__(self, canonical):
+        return canonical in self._display
+    
+    def forms(self):
+        """Return the (surface form, canonical name) pairs of the index."""
+        
+        return self._forms.items()
+    
+    def lookup(self, phrase):
+        """Return the canonical name for a surface form, or None."""
+        
+        return self._forms.get(phrase)
+    
+    def display_name(self, canonical):
+        """Return the preferred Turkish name of a canonical name."""
+        
+        return self._display[canonical]
+    
+    def closest(self, phrase):
+        """Return the (canonical name, similarity) of the name closest to a
+        possibly misspelled phrase, or None if no name is similar at all.
+        
+        The similarity is the share of the trigrams in common, among the
+        trigrams of both (1 if the phrase is exactly the name). Only the names
+        sharing a trigram with the phrase are compared.
+        """
+        
+        grams = self.trigrams(phrase)
+        
+        common = dict()
+        for i in grams:
+            for n in self._trigram_index.get(i, ()):
+                common[n] = common.get(n, 0) + 1
+        
+        if not common:
+            return None
+        
+        n, score = max(
+            (
+                (n, c / (len(grams) + len(self._name_trigrams[n]) - c))
+                for n, c in common.items()
+            ),
+            key=lambda i: i[1]
+        )
+        
+        return self._names[n][1], score
+    
+    def guess(self, words, known):
+        """Look up the unknown words of a message as misspelled names.
+        
+        words is the list of the words and known is the set of the indices of
+        the ones which are recognised. Two consecutive unknown words are tried
+        together first, for the names of two words. Return a list of (start,
+        end, canonical name) tuples of the accepted guesses in message order,
+        and a list of the canonical names to suggest for the rest.
+        """
+        
+        guesses = []
+        suggestions = []
+        
+        i = 0
+        while i < len(words):
+            if i in known or len(words[i]) < self.FUZZY_MIN_LENGTH:
+                i += 1
+                continue
+            
+            best = None
+            for n in (2, 1):
+                if n == 2 and (i + 1 in known or i + 1 == len(words)):
+                    continue
+                
+                found = self.closest(" ".join(words[i:i + n]))
+                
+                if found is not None and (best is None or found[1] > best[1]):
+                    best = (*found, n)
+            
+            if best is not None and best[1] >= self.FUZZY_ACCEPT:
+                guesses.append((i, i + best[2], best[0]))
+                i += best[2]
+                continue
+            
+            if best is not None and best[1] >= self.FUZZY_SUGGEST and \
+                    best[0] not in suggestions:
+                suggestions.append(best[0])
+            
+            i += 1
+        
+        return guesses, suggestions
+    
+    def resolve(self, match_result, label="location"):
+        """Pick the locations in a MatchResult, preferring longer matches.
+        
+        Overlapping location hits are resolved by keeping the longest one, so
+        that e.g. "papua yeni gine" does not also count as "gine".
+        Return a list of (start, end, canonical name) tuples in message order.
+        """
+        
+        hits = sorted(
+            (i for i in match_result.hits if i[2] == label),
+            key=lambda i: (i[0] - i[1], i[0])
+        )
+        
+        taken = set()
+        r = []
+        for start, end, _, val in hits:
+            span = range(start, end)
+            
+            if taken.isdisjoint(span):
+                taken.update(span)
+                r.append((start, end, val))
+        
+        r.sort()
+        
+        return r
+
+
+# Summed statistics of a location in a COVID daily report:
+CovidTotals = namedtuple(
+    "CovidTotals", ["confirmed", "active", "recovered", "deaths"]
+)
+
+
+class CovidReport:
+    """Per-country totals of a parsed COVID daily report, and their aggregates.
+    
+    The rows of the report are summed per Country_Region with a single
+    groupby. This enables the summation of data released seperately for
+    different states/provinces (e.g US, Australia...). Negative active case
+    counts are ignored, missing values are counted as zero.
+    
+    The world total, the totals of the regions (a dict of region names to
+    lists of countries, see dict_region_countries.txt) and the countries with
+    the most cases are computed from the per-country table when the report is
+    loaded, without going over the rows again. Then, get answers for a
+    country, a region or the world alike.
+    """
+    
+    COLUMNS = ["Confirmed", "Active", "Recovered", "Deaths"]
+    
+    # Names of the aggregates which are not regions:
+    WORLD = "World"
+    TOP = "Top Countries"
+    
+    # Number of the countries in top:
+    TOP_COUNT = 10
+    
+    def __init__(self, df, regions=None):
+        df = df.reindex(columns=["Country_Region"] + self.COLUMNS)
+        df["Active"] = df["Active"].where(df["Active"] > 0)
+        
+        sums = df.groupby("Country_Region")[self.COLUMNS].sum()
+        
+        # A (region, country) row for each membership, so that a country can
+        #   be in more than one region:
+        members = pd.DataFrame(
+            [(k, i) for k, v in (regions or dict()).items() for i in v],
+            columns=["Region", "Country_Region"]
+        )
+        region_sums = members.join(sums, on="Country_Region") \
+            .groupby("Region")[self.COLUMNS].sum()
+        
+        table = pd.concat(
+            [sums, region_sums, sums.sum().to_frame(self.WORLD).T]
+        )
+        
+        # Names of the locations which are not countries:
+        self.aggregates = set(region_sums.index) | {self.WORLD}
+        
+        self.totals = {
+            name: CovidTotals(*(int(i) for i in row))
+            for name, row in zip(
+                table.index, table.itertuples(index=False, name=None)
+            )
+        }
+        
+        # (country, CovidTotals) pairs of the countries with the most cases,
+        #   the most first. (Ranked by the cumulative counts, see
+        #   covid_ranking for the ranking by the new cases.)
+        self.top = [
+            (i, self.totals[i])
+            for i in sums.nlargest(self.TOP_COUNT, "Confirmed").index
+        ]
+    
+    @classmethod
+    def from_csv(cls, path, regions=None):
+        """Parse the report file at path. May raise pd.errors.ParserError."""
+        
+        return cls(pd.read_csv(path), regions)
+    
+    def get(self, location):
+        """Return the CovidTotals of a location, zeros if not in the report."""
+        
+        return self.totals.get(location, CovidTotals(0, 0, 0, 0))
+
+
+class CovidReportCache:
+    """Process-wide LRU cache of parsed COVID daily reports.
+    
+    Reports are keyed by (dataset, date) where dataset is "global" or "us" and
+    date is formatted as in the report file names. A report file is parsed only
+    once, until its entry is invalidated (e.g. when a fresh file is downloaded)
+    or evicted for being the least recently used one.
+    """
+    
+    def __init__(self, max_reports=4, regions=None, history=None):
+        self.max_reports = max_reports
+        # Passed to every CovidReport:
+        self.regions = regions
+        # CovidHistory to ingest every parsed report into, if any:
+        self.history = history
+        self._reports = OrderedDict()
+        self._latest = dict()
+        self._lock = Lock()
+    
+    def get(self, dataset, date, path):
+        """Return the CovidReport for the key, parsing the file at path if the
+        report is not cached. May raise pd.errors.ParserError."""
+        
+        key = (dataset, date)
+        
+        with self._lock:
+            report = self._reports.get(key)
+            
+            if report is not None:
+                self._reports.move_to_end(key)
+                return report
+        
+        # Parse outside the lock, so that reading another report does not
+        #   wait for this one:
+        report = CovidReport.from_csv(path, self.regions)
+        logger.info(f"Parsed COVID report {date} of {dataset} dataset.")
+        
+        if self.history is not None:
+            self.history.ingest(dataset, date, report)
+        
+        with self._lock:
+            self._reports[key] = report
+            self._reports.move_to_end(key)
+            
+            while len(self._reports) > self.max_reports:
+                self._reports.popitem(last=False)
+        
+        return report
+    
+    def invalidate(self, dataset, date):
+        """Drop the cached report of the key, if any."""
+        
+        with self._lock:
+            self._reports.pop((dataset, date), None)
+    
+    def latest(self, dataset):
+        """Return the date of the newest prefetched report of the dataset, or
+        None if nothing is prefetched yet."""
+        
+        return self._latest.get(dataset)
+    
+    def set_latest(self, dataset, date):
+        self._latest[dataset] = date
+
+
+# Daily changes of a location's COVID statistics, None where not known (see
+#   CovidHistory.changes):
+CovidChanges = namedtuple(
+    "CovidChanges",
+    ["new_cases", "new_deaths", "average_cases", "average_deaths"]
+)
+
+
+class CovidHistory:
+    """Cumulative COVID case and death counts of every location by date.
+    
+    The daily reports are deleted a few days after they are downloaded (see
+    db_cleanup), so the totals of each ingested report are kept here instead,
+    in a single integer array with a row per (dataset, location) pair, a
+    column per day and a layer per counted field. Days which were not ingested
+    hold MISSING. The array grows as new locations and days come in, and is
+    written to an .npz file at path after every ingestion, and read back from
+    it when it is first used.
+    
+    Day-over-day changes and weekly averages are then computed from two
+    columns of the array, without any of the old reports.
+    """
+    
+    FIELDS = ["confirmed", "deaths"]
+    MISSING = -1
+    
+    # Number of the days the averages are computed over:
+    AVERAGE_DAYS = 7
+    
+    def __init__(self, path=None):
+        self.path = path
+        # Ordinal (see datetime.date.toordinal) of the day of the first column:
+        self.start = None
+        # (Created or loaded when first needed, see _load_once.)
+        self.counts = None
+        self._rows = dict()
+        self._lock = Lock()
+        self._loaded = False
+    
+    def _load_once(self):
+        """Load the file on first use, so that numpy is not imported before
+        any COVID data is needed."""
+        
+        if not self._loaded:
+            self._loaded = True
+            self.load()
+    
+    @staticmethod
+    def _day(date):
+        """Return the ordinal of a date formatted as in the report names."""
+        
+        return dt.datetime.strptime(date, "%m-%d-%Y").toordinal()
+    
+    def _column(self, day):
+        """Return the column of a day ordinal, None if it is out of range."""
+        
+        if self.start is None or \
+                not 0 <= day - self.start < self.counts.shape[1]:
+            return None
+        
+        return day - self.start
+    
+    def load(self):
+        """Read the array back from the file at path, if there is one.
+        Return self."""
+        
+        if self.path is None:
+            return self
+        
+        try:
+            with np.load(self.path) as data:
+                names = [tuple(i) for i in data["names"].tolist()]
+                start = int(data["start"])
+                counts = data["counts"]
+        except (OSError, KeyError, ValueError):
+            return self
+        
+        with self._lock:
+            self._rows = {name: row for row, name in enumerate(names)}
+            self.start = start
+            self.counts = counts
+        
+        return self
+    
+    def save(self):
+        """Write the array to the file at path."""
+        
+        if self.path is None or self.counts is None:
+            return
+        
+        with self._lock:
+            names = np.array(sorted(self._rows, key=self._rows.get), str) \
+                .reshape(-1, 2)
+            
+            # Write to a temporary file first, so that a crash can not leave
+            #   a partially written file behind:
+            with open(self.path + ".tmp", "wb") as f:
+                np.savez(f, names=names, start=self.start, counts=self.counts)
+            
+            os.replace(self.path + ".tmp", self.path)
+    
+    def has(self, dataset, date):
+        """Return whether a report of the dataset was ingested for date."""
+        
+        self._load_once()
+        
+        with self._lock:
+            column = self._column(self._day(date))
+            rows = [v for k, v in self._rows.items() if k[0] == dataset]
+            
+            return column is not None and bool(rows) \
+                and bool((self.counts[rows, column, 0] != self.MISSING).any())
+    
+    def ingest(self, dataset, date, report):
+        """Store the totals of a CovidReport of the dataset for date."""
+        
+        day = self._day(date)
+        names = list(report.totals)
+        
+        self._load_once()
+        
+        with self._lock:
+            for name in names:
+                self._rows.setdefault((dataset, name), len(self._rows))
+            
+            # Grow the array to fit the new rows and the day:
+            if self.start is None:
+                self.start = day
+                self.counts = np.full(
+                    (0, 0, len(self.FIELDS)), self.MISSING, np.int64
+                )
+            
+            before = max(self.start - day, 0)
+            after = max(day - self.start - self.counts.shape[1] + 1, 0)
+            
+            self.counts = np.pad(
+                self.counts,
+                ((0, len(self._rows) - self.counts.shape[0]), (before, after),
+                 (0, 0)),
+                constant_values=self.MISSING
+            )
+            self.start -= before
+            
+            rows = [self._rows[(dataset, i)] for i in names]
+            self.counts[rows, day - self.start] = [
+                [getattr(report.totals[i], j) for j in self.FIELDS]
+                for i in names
+            ]
+        
+        logger.info(f"Ingested COVID report {date} of {dataset} dataset.")
+        
+        self.save()
+    
+    def changes(self, dataset, location, date):
+        """Return the CovidChanges of a location on date."""
+        
+        day = self._day(date)
+        
+        self._load_once()
+        
+        with self._lock:
+            row = self._rows.get((dataset, location))
+            
+            def counts_of(day):
+                column = self._column(day)
+                
+                if row is None or column is None:
+                    return None
+                
+                counts = self.counts[row, column]
+                
+                return None if (counts == self.MISSING).any() else counts
+            
+            today = counts_of(day)
+            yesterday = counts_of(day - 1)
+            week_ago = counts_of(day - self.AVERAGE_DAYS)
+        
+        new = average = (None, None)
+        
+        if today is not None and yesterday is not None:
+            new = [int(i) for i in today - yesterday]
+        
+        if today is not None and week_ago is not None:
+            average = [
+                float(i) for i in (today - week_ago) / self.AVERAGE_DAYS
+            ]
+        
+        return CovidChanges(*new, *average)
+    
+    def top_new_cases(self, dataset, date, locations, count):
+        """Return the (location, new cases) pairs of the count locations with
+        the most new cases on date, the most first. Locations missing the
+        counts of date or of the day before are left out."""
+        
+        day = self._day(date)
+        
+        self._load_once()
+        
+        with self._lock:
+            today = self._column(day)
+            yesterday = self._column(day - 1)
+            rows = [
+                (i, self._rows[(dataset, i)]) for i in locations
+                if (dataset, i) in self._rows
+            ]
+            
+            if today is None or yesterday is None or not rows:
+                return []
+            
+            cases = self.counts[[i for _, i in rows]][:, [yesterday, today], 0]
+        
+        known = (cases != self.MISSING).all(axis=1)
+        new = cases[:, 1] - cases[:, 0]
+        
+        return [
+            (rows[i][0], int(new[i]))
+            for i in np.argsort(-new, kind="stable") if known[i]
+        ][:count]
+
+
+class CovidFetcher:
+    """Keeps local copies of the COVID daily reports up to date.
+    
+    The freshness of every report URL is tracked separately: a local file is
+    used without any request if it was checked in the last max_age. Otherwise,
+    a conditional GET is made with the ETag and Last-Modified values stored
+    next to the file (in "<file>.meta"), so that an unchanged report is not
+    downloaded again. All requests share a pooled requests.Session.
+    
+    The newest available date of a dataset is found by probing the candidate
+    dates concurrently, and is remembered for max_age.
+    
+    The base URL can be changed, e.g. to test against a local HTTP server.
+    """
+    
+    BASE_URL = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19" \
+        "/master/csse_covid_19_data/"
+    
+    # URL directory and local subdirectory of each dataset:
+    DATASETS = {
+        "global": ("csse_covid_19_daily_reports/", ""),
+        "us": ("csse_covid_19_daily_reports_us/", "us_data/")
+    }
+    
+    # Return values of fetch:
+    FRESH = "fresh"  # Local file checked recently, no request made
+    NOT_MODIFIED = "not_modified"  # Local file is still up to date (304)
+    DOWNLOADED = "downloaded"  # New contents written to the local file
+    MISSING = "missing"  # The report does not exist (yet) and no local copy
+    
+    def __init__(self, data_dir, base_url=BASE_URL,
+                 max_age=dt.timedelta(hours=3), timeout=15):
+        self.data_dir = data_dir
+        self.base_url = base_url
+        self.max_age = max_age
+        self.timeout = timeout
+        self._session = None
+        
+        # Last successful check time of every URL:
+        self._checked = dict()
+        # (date, resolve time) of the newest available report of every dataset:
+        self._resolved = dict()
+        self._url_locks = dict()
+        self._lock = Lock()
+    
+    @property
+    def session(self):
+        # (Created on first use, so that requests is not imported before any
+        #   report is needed.)
+        if self._session is None:
+            self._session = requests.Session()
+        
+        return self._session
+    
+    def url(self, dataset, date):
+        return self.base_url + self.DATASETS[dataset][0] + date + ".csv"
+    
+    def path(self, dataset, date):
+        return self.data_dir + self.DATASETS[dataset][1] + date + ".csv"
+    
+    def _url_lock(self, url):
+        with self._lock:
+            return self._url_locks.setdefault(url, Lock())
+    
+    @staticmethod
+    def _read_meta(path):
+        try:
+            with open(path + ".meta", "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict()
+    
+    @staticmethod
+    def _write(path, data):
+        # Write to a temporary file first, so that a half written report is
+        #   never read:
+        temp_path = path + ".part"
+        
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        
+        os.replace(temp_path, path)
+    
+    def _probe(self, url):
+        """Return True if a HEAD request to url succeeds."""
+        
+        try:
+            response = self.session.head(
+                url, allow_redirects=True, timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            logger.warning(f"Could not request {url}: {e}")
+            return False
+        
+        return response.status_code // 100 == 2
+    
+    def resolve_latest(self, dataset, dates, force=False):
+        """Return the newest date in dates which has a report, or None.
+        
+        dates must be ordered from newest to oldest. The candidates are probed
+        concurrently, unless a date was resolved for the dataset in the last
+        max_age and force is False. If no probe succeeds (e.g. the network is
+        down), the newest date with a local file is returned.
+        """
+        
+        resolved = self._resolved.get(dataset)
+        
+        if (not force and resolved
+                and (dt.datetime.now() - resolved[1]) < self.max_age):
+            return resolved[0]
+        
+        with ThreadPoolExecutor(max_workers=len(dates)) as executor:
+            found = list(executor.map(
+                self._probe, [self.url(dataset, i) for i in dates]
+            ))
+        
+        for date, ok in zip(dates, found):
+            if ok:
+                self._resolved[dataset] = (date, dt.datetime.now())
+                return date
+        
+        for date in dates:
+            if os.path.exists(self.path(dataset, date)):
+                return date
+        
+        return None
+    
+    def fetch(self, dataset, date, force=False):
+        """Make sure the report of the given dataset and date is on disk.
+        
+        If force is True, revalidate the local file even if it was checked
+        recently. Return one of FRESH, NOT_MODIFIED, DOWNLOADED and MISSING.
+        """
+        
+        url = self.url(dataset, date)
+        path = self.path(dataset, date)
+        
+        with self._url_lock(url):
+            exists = os.path.exists(path)
+            last = self._checked.get(url)
+            
+            if (not force and exists and last
+                    and (dt.datetime.now() - last) < self.max_age):
+                return self.FRESH
+            
+            headers = dict()
+            if exists:
+                meta = self._read_meta(path)
+                
+                if meta.get("etag"):
+                    headers["If-None-Match"] = meta["etag"]
+                if meta.get("last_modified"):
+                    headers["If-Modified-Since"] = meta["last_modified"]
+            
+            try:
+                response = self.session.get(
+                    url, headers=headers, timeout=self.timeout
+                )
+            except requests.RequestException as e:
+                logger.warning(f"Could not request {url}: {e}")
+                
+                # Keep using the local file if there is one:
+                return self.NOT_MODIFIED if exists else self.MISSING
+            
+            if response.status_code == 304:
+                logger.info(f"Not modified since last retrieval: {url}")
+                self._checked[url] = dt.datetime.now()
+                
+                return self.NOT_MODIFIED
+            
+            # Note that requests module handles 3xx (redirection) and issues
+            #   the new status code instead.
+            if response.status_code // 100 != 2:
+                logger.info(f"HTTP {response.status_code} for: {url}")
+                
+                return self.NOT_MODIFIED if exists else self.MISSING
+            
+            self._write(path, response.content)
+            self._write(path + ".meta", json.dumps({
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified")
+            }).encode())
+            self._checked[url] = dt.datetime.now()
+            
+            logger.info(f"Retrieved file from {url}, written in database.")
+            
+            return self.DOWNLOADED
+
+
+class StartupTimer:
+    """Measures the steps of the startup, to be logged once the bot is ready.
+    
+    The first step, "imports", is the CPU time of the process until the timer
+    is created, which covers the interpreter startup and the imports. The
+    other steps are the wall-clock times between the calls of step.
+    """
+    
+    def __init__(self):
+        self.steps = [("imports", process_time())]
+        self._last = monotonic()
+    
+    def step(self, name):
+        """End the current step, naming it name."""
+        
+        now = monotonic()
+        self.steps.append((name, now - self._last))
+        self._last = now
+    
+    def report(self):
+        """Return a line with the total and the step times."""
+        
+        total = sum(i for _, i in self.steps)
+        steps = ", ".join(f"{k}: {v * 1000:.0f} ms" for k, v in self.steps)
+        
+        return f"Started up in {total * 1000:.0f} ms ({steps})."
+
+
+class StartupSnapshot:
+    """Pickled copy of the values built from the resource files at startup
+    (e.g. KEYWORD_MATCHER), read in a single go instead of building them
+    again.
+    
+    The snapshot is used only if the modification times and sizes of its
+    source files (the resource files and this module) are the same as when it
+    was written. Otherwise, every value is built again by get and the snapshot
+    is rewritten by save.
+    """
+    
+    def __init__(self, path, sources):
+        self.path = path
+        self.sources = sources
+        self.loaded = False
+        
+        self._stamps = None
+        self._values = dict()
+        self._built = False
+    
+    def stamps(self):
+        """Return the (modification time, size) pairs of the source files."""
+        
+        stamps = dict()
+        for i in self.sources:
+            try:
+                st = os.stat(i)
+            except OSError:
+                continue
+            
+            stamps[i] = (st.st_mtime_ns, st.st_size)
+        
+        return stamps
+    
+    def load(self):
+        """Read the values from the file at path, if it is up to date with the
+        sources. Return self."""
+        
+        self._stamps = self.stamps()
+        
+        try:
+            with open(self.path, "rb") as f:
+                stamps, values = pickle.load(f)
+        except FileNotFoundError:
+            return self
+        except (OSError, EOFError, AttributeError, ImportError, ValueError,
+                TypeError, pickle.UnpicklingError) as e:
+            logger.warning(f"Could not read the startup snapshot: {e}")
+            
+            return self
+        
+        if stamps == self._stamps:
+            self._values = values
+            self.loaded = True
+        else:
+            logger.info("Startup snapshot is out of date, rebuilding it.")
+        
+        return self
+    
+    def get(self, name, build):
+        """Return the value stored as name, or build it with the function
+        build if it is not in the snapshot."""
+        
+        if name not in self._values:
+            self._values[name] = build()
+            self._built = True
+        
+        return self._values[name]
+    
+    def save(self):
+        """Write the values to the file at path, if any of them was built."""
+        
+        if not self._built:
+            return
+        
+        if self._stamps is None:
+            self._stamps = self.stamps()
+        
+        try:
+            # Write to a temporary file first, so that a crash can not leave
+            #   a partially written snapshot behind:
+            with open(self.path + ".tmp", "wb") as f:
+                pickle.dump(
+                    (self._stamps, self._values), f, pickle.HIGHEST_PROTOCOL
+                )
+            
+            os.replace(self.path + ".tmp", self.path)
+        except (OSError, pickle.PicklingError) as e:
+            logger.warning(f"Could not write the startup snapshot: {e}")
+            
+            return
+        
+        self._built = False
+        
+        logger.info(f"Startup snapshot written to {self.path}.")
+
+
+class ChatStateStore:
+    """Thread-safe mapping of chat IDs to values which expire after a while.
+    
+    Meant for the short-lived, per-chat data of interactive processes (e.g. the
+    state of a chat in an announcement dialogue), which is read and written by
+    the handlers and the jobs on different threads. Supports the dict
+    operations used on the plain dicts it replaces: "in", [], del, get, pop,
+    items and len. An expired entry is treated as if it did not exist, and is
+    dropped on the next access or purge.
+    
+    Every entry expires ttl (a timedelta) after it was last set, or never if
+    ttl is None. If a path is given, the unexpired entries can be written to it
+    with snapshot and read back with load, so that they survive a restart.
+    """
+    
+    def __init__(self, ttl=None, path=None):
+        self.ttl = ttl
+        self.path = path
+        self._lock = Lock()
+        # Chat ID -> (value, expiry time as a UNIX timestamp or None):
+        self._entries = dict()
+        self._dirty = False
+    
+    def _expiry(self, at=None):
+        if self.ttl is None:
+            return None
+        
+        return (time() if at is None else at) + self.ttl.total_seconds()
+    
+    def _alive(self, chat_id, now):
+        # Must be called with the lock held.
+        try:
+            value, expires = self._entries[chat_id]
+        except KeyError:
+            return False
+        
+        if expires is not None and expires <= now:
+            del self._entries[chat_id]
+            self._dirty = True
+            return False
+        
+        return True
+    
+    def set(self, chat_id, value, at=None):
+        """Set the value of a chat. at is the UNIX timestamp to count the
+        expiry from, the current time by default."""
+        
+        with self._lock:
+            self._entries[chat_id] = (value, self._expiry(at))
+            self._dirty = True
+    
+    def get(self, chat_id, default=None):
+        with self._lock:
+            if self._alive(chat_id, time()):
+                return self._entries[chat_id][0]
+            
+            return default
+    
+    def pop(self, chat_id, default=None):
+        with self._lock:
+            if self._alive(chat_id, time()):
+                self._dirty = True
+                return self._entries.pop(chat_id)[0]
+            
+            return default
+    
+    def set_new(self, chat_id, value):
+        """Set the value of a chat only if it has none. Return None if the
+        value was set, else the existing value."""
+        
+        with self._lock:
+            if self._alive(chat_id, time()):
+                return self._entries[chat_id][0]
+            
+            self._entries[chat_id] = (value, self._expiry())
+            self._dirty = True
+        
+        return None
+    
+    def items(self):
+        """Return a list of the unexpired (chat ID, value) pairs."""
+        
+        now = time()
+        
+        with self._lock:
+            return [
+                (k, v) for k, (v, expires) in self._entries.items()
+                if expires is None or expires > now
+            ]
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+    
+    def purge(self):
+        """Drop the expired entries. Return the number of dropped entries."""
+        
+        now = time()
+        
+        with self._lock:
+            expired = [
+                k for k, (v, expires) in self._entries.items()
+                if expires is not None and expires <= now
+            ]
+            for i in expired:
+                del self._entries[i]
+            
+            if expired:
+                self._dirty = True
+        
+        return len(expired)
+    
+    def __contains__(self, chat_id):
+        with self._lock:
+            return self._alive(chat_id, time())
+    
+    def __getitem__(self, chat_id):
+        with self._lock:
+            if self._alive(chat_id, time()):
+                return self._entries[chat_id][0]
+        
+        raise KeyError(chat_id)
+    
+    def __setitem__(self, chat_id, value):
+        self.set(chat_id, value)
+    
+    def __delitem__(self, chat_id):
+        with self._lock:
+            if not self._alive(chat_id, time()):
+                raise KeyError(chat_id)
+            
+            del self._entries[chat_id]
+            self._dirty = True
+    
+    def __len__(self):
+        return len(self.items())
+    
+    def load(self):
+        """Read the entries back from the snapshot file, if there is one.
+        Return self."""
+        
+        if self.path is None:
+            return self
+        
+        try:
+            with open(self.path, "r") as f:
+                records = json.load(f)
+        except (OSError, ValueError):
+            return self
+        
+        now = time()
+        
+        with self._lock:
+            for chat_id, value, expires in records:
+                if expires is None or expires > now:
+                    self._entries[chat_id] = (value, expires)
+            
+            self._dirty = False
+        
+        return self
+    
+    def snapshot(self):
+        """Write the unexpired entries to the snapshot file if they changed
+        since the last snapshot."""
+        
+        if self.path is None:
+            return
+        
+        now = time()
+        
+        with self._lock:
+            if not self._dirty:
+                return
+            
+            records = [
+                [k, v, expires] for k, (v, expires) in self._entries.items()
+                if expires is None or expires > now
+            ]
+            
+            # Write to a temporary file first, so that a crash can not leave
+            #   a partially written snapshot behind:
+            with open(self.path + ".tmp", "w") as f:
+                json.dump(records, f)
+            
+            os.replace(self.path + ".tmp", self.path)
+            self._dirty = False
+
+
+class Broadcast:
+    """Sends an announcement to many chats and keeps track of its delivery.
+    
+    Every message is submitted to the bot's OutboundScheduler at once, with
+    the broadcast priority, and the resulting promises are collected on a
+    separate thread. The delivery state
+    of each recipient (sent, failed or blocked) is appended to a journal file
+    as soon as it is known, so that an interrupted broadcast can be resumed
+    with the remaining recipients after a restart. (A message which was being
+    sent during the interruption may thus be delivered twice.)
+    
+    The progress and the throughput are reported to the admin chat which
+    started the broadcast.
+    """
+    
+    SENT = "sent"
+    FAILED = "failed"
+    BLOCKED = "blocked"  # The bot was blocked by or removed from the chat
+    
+    # Minimum number of seconds between two progress reports:
+    REPORT_INTERVAL = 30
+    
+    # Bots can delete their messages only within 48 hours after sending them:
+    DELETE_WINDOW = dt.timedelta(hours=48)
+    
+    def __init__(self, path, text, recipients, admin_chat):
+        self.path = path
+        self.text = text
+        self.recipients = list(recipients)
+        self.admin_chat = admin_chat
+        self.states = dict()
+        self.done = False
+        
+        # Message IDs of the delivered announcements, keyed by chat IDs. They
+        #   expire when they can no longer be deleted:
+        self.delivered = ChatStateStore(ttl=self.DELETE_WINDOW)
+        
+        self._lock = Lock()
+        self._thread = None
+    
+    @classmethod
+    def create(cls, path, text, recipients, admin_chat):
+        """Make a new broadcast, replacing the journal of the previous one."""
+        
+        broadcast = cls(path, text, recipients, admin_chat)
+        
+        with open(path, "w") as f:
+            f.write(json.dumps({
+                "text": text,
+                "recipients": broadcast.recipients,
+                "admin_chat": admin_chat
+            }) + "\n")
+        
+        return broadcast
+    
+    @classmethod
+    def load(cls, path):
+        """Read a broadcast back from its journal. Return None if there is
+        no readable journal at path."""
+        
+        try:
+            with open(path, "r") as f:
+                lines = f.readlines()
+        except OSError:
+            return None
+        
+        if lines and not lines[-1].endswith("\n"):
+            # Terminate the partially written last line, so that the records
+            #   appended when resuming are on lines of their own:
+            with open(path, "a") as f:
+                f.write("\n")
+        
+        broadcast = None
+        
+        for i in lines:
+            try:
+                record = json.loads(i)
+            except ValueError:
+                # A partially written last line, skip it
+                continue
+            
+            if broadcast is None:
+                broadcast = cls(
+                    path,
+                    record["text"],
+                    record["recipients"],
+                    record["admin_chat"]
+                )
+            elif "done" in record:
+                broadcast.done = True
+            elif "revoked" in record:
+                broadcast.delivered.clear()
+            else:
+                broadcast.states[record["chat"]] = record["status"]
+                
+                if record["status"] == cls.SENT:
+                    # (Records of older journals have no time, their messages
+                    #   are assumed to be sent right now.)
+                    broadcast.delivered.set(
+                        record["chat"], record["msg"], at=record.get("time")
+                    )
+        
+        return broadcast
+    
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+    
+    def pending(self):
+        """Return the recipients without a known delivery state."""
+        
+        return [i for i in self.recipients if i not in self.states]
+    
+    def counts(self):
+        """Return the number of recipients in each delivery state."""
+        
+        r = {self.SENT: 0, self.FAILED: 0, self.BLOCKED: 0}
+        for i in self.states.values():
+            r[i] += 1
+        
+        return r
+    
+    def _append(self, record):
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+    
+    def start(self, bot):
+        """Start (or resume) sending on a new thread and return immediately.
+        
+        bot must be a SanalkiwoBot, whose send_message returns promises.
+        """
+        
+        self._thread = Thread(
+            target=self._run, args=(bot,), name="broadcast", daemon=True
+        )
+        self._thread.start()
+    
+    def mark_revoked(self):
+        """Record that the delivered messages were (tried to be) deleted."""
+        
+        self._append({"revoked": True})
+    
+    def _report(self, bot, text):
+        # Interactive priority, so that the report is not stuck behind the
+        #   broadcast:
+        bot.send_message(
+            self.admin_chat, text, priority=OutboundScheduler.INTERACTIVE
+        )
+    
+    def _run(self, bot):
+        pending = self.pending()
+        total = len(self.recipients)
+        start_time = dt.datetime.now()
+        last_report = start_time
+        
+        logger.info(
+            f"Beginning mass announcement: {len(pending)} of {total}"
+            " recipients left."
+        )
+        
+        promises = [
+            (i, bot.send_message(
+                i, self.text, priority=OutboundScheduler.BROADCAST
+            ))
+            for i in pending
+        ]
+        
+        for processed, (chat, promise) in enumerate(promises, start=1):
+            promise.done.wait()
+            exc = promise.exception
+            
+            if exc is None:
+                msg_id = promise.result().message_id
+                status = self.SENT
+                self.delivered[chat] = msg_id
+                
+                logger.info(
+                    f"Announcement sent to recipient ID {chat} with message ID"
+                    f" {msg_id}"
+                )
+            else:
+                msg_id = None
+                status = self.BLOCKED if isinstance(exc, Unauthorized) \
+                    else self.FAILED
+                
+                logger.warning(
+                    f"Announcement to recipient ID {chat} failed: {exc}"
+                )
+            
+            self.states[chat] = status
+            self._append({
+                "chat": chat, "status": status, "msg": msg_id, "time": time()
+            })
+            
+            now = dt.datetime.now()
+            if (now - last_report).total_seconds() >= self.REPORT_INTERVAL:
+                last_report = now
+                elapsed = (now - start_time).total_seconds()
+                
+                self._report(
+                    bot,
+                    f"duyuru: {len(self.states)}/{total} alıcı tamam"
+                    f" ({processed / elapsed:.1f} mesaj/sn)"
+                )
+        
+        self.done = True
+        self._append({"done": True})
+        
+        counts = self.counts()
+        elapsed = (dt.datetime.now() - start_time).total_seconds()
+        
+        logger.info(f"Finished mass announcement: {counts}")
+        
+        self._report(
+            bot,
+            f"duyuru bitti! {counts[self.SENT]} gönderildi,"
+            f" {counts[self.FAILED]} gönderilemedi, {counts[self.BLOCKED]}"
+            f" alıcı botu engellemiş. ({elapsed:.0f} sn sürdü)"
+        )
+
+
+class ChatSetStore:
+    """Log-structured storage of a set of chat IDs.
+    
+    A set is stored in two files: a snapshot with one ID per line (the format
+    of the original database files, e.g. chats.txt) and an append-only log
+    next to it ("<snapshot>.log") holding "+<ID>" and "-<ID>" records of the
+    changes made since the snapshot. On startup, the log is replayed on top
+    of the snapshot.
+    
+    Mutations are serialized with a lock. Every record is flushed when it is
+    written, but the log is fsync'ed only once in a batch of records (or when
+    sync is called). Once the log grows long enough, it is compacted into a new
+    snapshot.
+    """
+    
+    def __init__(self, path, compact_after=1000, sync_every=16):
+        self.path = path
+        self.log_path = path + ".log"
+        self.compact_after = compact_after
+        self.sync_every = sync_every
+        self.lock = Lock()
+        
+        self._log = None
+        self._log_len = 0
+        self._unsynced = 0
+    
+    def load(self):
+        """Read the set from the snapshot and the log, and return it.
+        
+        If the log holds any records, it is compacted right away.
+        """
+        
+        db = db_read(self.path, read_int=True)
+        
+        with self.lock:
+            try:
+                with open(self.log_path, "r") as f:
+                    for i in f:
+                        # A partially written last record has no newline:
+                        if not i.endswith("\n"):
+                            break
+                        
+                        if i.startswith("+"):
+                            db.add(int(i[1:]))
+                        elif i.startswith("-"):
+                            db.discard(int(i[1:]))
+                        
+                        self._log_len += 1
+            except FileNotFoundError:
+                pass
+            
+            if self._log_len:
+                self._compact(db)
+        
+        return db
+    
+    def _append(self, record):
+        if self._log is None:
+            self._log = open(self.log_path, "a")
+        
+        self._log.write(record + "\n")
+        self._log.flush()
+        
+        self._log_len += 1
+        self._unsynced += 1
+        
+        if self._unsynced >= self.sync_every:
+            self._sync()
+    
+    def _sync(self):
+        if self._log is not None and self._unsynced:
+            os.fsync(self._log.fileno())
+            self._unsynced = 0
+    
+    def _compact(self, db):
+        temp_path = self.path + ".tmp"
+        
+        with open(temp_path, "w") as f:
+            for i in db:
+                f.write(str(i) + "\n")
+            
+            f.flush()
+            os.fsync(f.fileno())
+        
+        os.replace(temp_path, self.path)
+        
+        # The records are in the snapshot now, start a new log:
+        if self._log is not None:
+            self._log.close()
+        
+        self._log = open(self.log_path, "w")
+        self._log_len = 0
+        self._unsynced = 0
+        
+        logger.info(f"Compacted chat database {self.path}.")
+    
+    def add(self, db, entry, chat_type=None):
+        """Add entry to db and record it. Return False if already in db.
+        
+        chat_type is not stored by this backend.
+        """
+        
+        with self.lock:
+            if entry in db:
+                return False
+            
+            self._append(f"+{entry}")
+            db.add(entry)
+            
+            if self._log_len >= self.compact_after:
+                self._compact(db)
+        
+        return True
+    
+    def remove(self, db, entry):
+        """Remove entry from db and record it. Return False if not in db."""
+        
+        with self.lock:
+            if entry not in db:
+                return False
+            
+            self._append(f"-{entry}")
+            db.remove(entry)
+            
+            if self._log_len >= self.compact_after:
+                self._compact(db)
+        
+        return True
+    
+    def sync(self):
+        """fsync the records which are not fsync'ed yet."""
+        
+        with self.lock:
+            self._sync()
+    
+    def copy(self, db):
+        """Return a copy of db, taken while no entry is added or removed."""
+        
+        with self.lock:
+            return set(db)
+
+
+class ChatDatabase:
+    """SQLite storage of the chat registry, an alternative to ChatSetStore.
+    
+    Every known chat is a row with its type, its announcement subscription
+    flag and the creation and last update timestamps. The database is used in
+    WAL mode, with an index on the subscription flag and the chat type for
+    picking the announcement recipients.
+    
+    The text file databases are migrated into it once, on the first boot with
+    this backend.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+        
+        # Autocommit mode, transactions are opened explicitly:
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        
+        with self.lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chats ("
+                " id INTEGER PRIMARY KEY,"
+                " type TEXT,"
+                " subscribed INTEGER NOT NULL DEFAULT 1,"
+                " created_at TEXT NOT NULL,"
+                " updated_at TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS chats_subscribed_type"
+                " ON chats (subscribed, type)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta"
+                " (key TEXT PRIMARY KEY, value TEXT)"
+            )
+    
+    @staticmethod
+    def _now():
+        return dt.datetime.utcnow().isoformat(timespec="seconds")
+    
+    def _query(self, sql, params=()):
+        with self.lock:
+            return [i[0] for i in self._conn.execute(sql, params)]
+    
+    def migrate(self, chats_path, blist_path):
+        """Import the text file databases, unless it was done before."""
+        
+        if self._query("SELECT value FROM meta WHERE key = 'migrated'"):
+            return
+        
+        chats = ChatSetStore(chats_path).load()
+        blist = ChatSetStore(blist_path).load()
+        now = self._now()
+        
+        with self.lock:
+            self._conn.execute("BEGIN")
+            
+            # NOTE: The types below rely on the negative chat ID property of
+            #   groups. Keep in mind that this property is not officially
+            #   defined and may be subject to change.
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO chats VALUES (?, ?, ?, ?, ?)",
+                [
+                    (i, "group" if i < 0 else "private", int(i not in blist),
+                     now, now)
+                    for i in chats | blist
+                ]
+            )
+            self._conn.execute(
+                "INSERT INTO meta VALUES ('migrated', ?)", (now,)
+            )
+            self._conn.execute("COMMIT")
+        
+        logger.info(
+            f"Migrated {len(chats | blist)} chats from the text databases into"
+            f" {self.path}."
+        )
+    
+    def register(self, chat_id, chat_type=None):
+        with self.lock:
+            now = self._now()
+            
+            self._conn.execute(
+                "INSERT OR IGNORE INTO chats VALUES (?, ?, 1, ?, ?)",
+                (chat_id, chat_type, now, now)
+            )
+            
+            if chat_type is not None:
+                self._conn.execute(
+                    "UPDATE chats SET type = ? WHERE id = ? AND type IS NULL",
+                    (chat_type, chat_id)
+                )
+    
+    def unregister(self, chat_id):
+        with self.lock:
+            self._conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+    
+    def set_subscribed(self, chat_id, subscribed):
+        self.register(chat_id)
+        
+        with self.lock:
+            self._conn.execute(
+                "UPDATE chats SET subscribed = ?, updated_at = ? WHERE id = ?",
+                (int(subscribed), self._now(), chat_id)
+            )
+    
+    def chats(self):
+        return set(self._query("SELECT id FROM chats"))
+    
+    def unsubscribed(self):
+        return set(self._query("SELECT id FROM chats WHERE subscribed = 0"))
+    
+    def subscribed(self, chat_types=None):
+        """Return the subscribed chats, optionally only of the given types."""
+        
+        if chat_types is None:
+            return self._query("SELECT id FROM chats WHERE subscribed = 1")
+        
+        chat_types = list(chat_types)
+        
+        return self._query(
+            "SELECT id FROM chats WHERE subscribed = 1 AND type IN (%s)"
+            % ", ".join("?" * len(chat_types)),
+            chat_types
+        )
+    
+    def subscribed_groups(self):
+        return self.subscribed(("group", "supergroup"))
+    
+    def subscribed_private_chats(self):
+        return self.subscribed(("private",))
+    
+    def checkpoint(self):
+        """Write the WAL into the database file, e.g. before copying it."""
+        
+        with self.lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+class ChatDatabaseSet:
+    """A chat ID set stored in a ChatDatabase.
+    
+    Has the interface of ChatSetStore, so that db_add, db_remove and
+    db_recipients work the same with both backends. If blist is True, the set
+    is that of the chats which are not subscribed to the announcements.
+    
+    Changes of the set are serialized with a lock, like in ChatSetStore.
+    """
+    
+    def __init__(self, database, blist=False):
+        self.database = database
+        self.blist = blist
+        self.lock = Lock()
+    
+    def load(self):
+        if self.blist:
+            return self.database.unsubscribed()
+        
+        return self.database.chats()
+    
+    def add(self, db, entry, chat_type=None):
+        with self.lock:
+            if entry in db:
+                return False
+            
+            if self.blist:
+                self.database.set_subscribed(entry, False)
+            else:
+                self.database.register(entry, chat_type)
+            
+            db.add(entry)
+        
+        return True
+    
+    def remove(self, db, entry):
+        with self.lock:
+            if entry not in db:
+                return False
+            
+            if self.blist:
+                self.database.set_subscribed(entry, True)
+            else:
+                self.database.unregister(entry)
+            
+            db.remove(entry)
+        
+        return True
+    
+    def sync(self):
+        # SQLite makes the changes durable itself.
+        pass
+    
+    def copy(self, db):
+        """Return a copy of db, taken while no entry is added or removed."""
+        
+        with self.lock:
+            return set(db)
+
+
+class BackupScheduler:
+    """Coalesces the chat database changes into backups for the admin groups.
+    
+    The changes are reported with record. The first change after a backup
+    schedules the next one on the JobQueue, window later, so that a burst of
+    changes results in a single backup. The backup job runs on the JobQueue's
+    thread, not on the dispatcher's.
+    
+    A backup is normally a delta: a text file with the changes since the
+    previous backup, one per line as "<file name> +<chat ID>" or "<file name>
+    -<chat ID>". The first backup after startup and every full_every-th backup
+    after that are full archives of the chat data directory instead.
+    """
+    
+    def __init__(self, window=dt.timedelta(minutes=5), full_every=12):
+        self.window = window
+        self.full_every = full_every
+        self.job_queue = None
+        
+        self._changes = []
+        self._job = None
+        self._count = 0
+        self._lock = Lock()
+    
+    def start(self, job_queue):
+        """Start scheduling backups on the given JobQueue."""
+        
+        with self._lock:
+            self.job_queue = job_queue
+            
+            if self._changes and self._job is None:
+                self._schedule()
+    
+    def _schedule(self):
+        self._job = self.job_queue.run_once(
+            self._run, self.window.total_seconds(), name="db_backup"
+        )
+    
+    def record(self, op, src_path, chat_id):
+        """Report an addition ("+") to or a removal ("-") from a database."""
+        
+        with self._lock:
+            self._changes.append(
+                f"{os.path.basename(src_path)} {op}{chat_id}"
+            )
+            
+            if self._job is None and self.job_queue is not None:
+                self._schedule()
+    
+    def _run(self, context):
+        with self._lock:
+            changes = self._changes
+            self._changes = []
+            self._job = None
+            
+            full = (self._count % self.full_every == 0)
+            self._count += 1
+        
+        groups = db_admin_groups()
+        
+        if not groups:
+            logger.info("No admin groups to send the backup to.")
+            return
+        
+        if full:
+            db_send_archive(context.bot, groups, force=False)
+            return
+        
+        name = db_backup_name("DELTA_") + ".txt"
+        data = ("\n".join(changes) + "\n").encode()
+        
+        logger.info(f"Sending backup delta of {len(changes)} changes: {name}")
+        
+        for i in groups:
+            context.bot.send_document(
+                i,
+                io.BytesIO(data),
+                filename=name,
+                priority=OutboundScheduler.BACKGROUND
+            )
+
+
 ## Non-command (helper) functions: ##
 
 def choose_one(ls):
@@ -87,38 +3001,61 @@ def choose_one(ls):
     return ls[randint(0, len(ls) - 1)]
 
 
-def get_first_key(dictn, val):
-    """Find first occurence of a key for a given value in a dictionary."""
+def build_keyword_matcher():
+    """Compile the word sets and the location names into a PhraseMatcher.
+    
+    Word set phrases are labelled with the name of their set (e.g. "kiwo" for
+    WS_KIWO). The surface forms of LOCATION_INDEX are labelled "location" and
+    valued with the corresponding canonical location name. The phrases of
+    WS_RANKING are labelled "ranking" and valued with CovidReport.TOP, to be
+    resolved like the location names.
+    """
+    
+    m = PhraseMatcher()
+    
+    for label, ws in (
+        ("kiwo", WS_KIWO),
+        ("group", WS_GROUP),
+        ("greet", WS_GREET),
+        ("whatsup", WS_WHATSUP),
+        ("request", WS_REQUEST),
+        ("corona", WS_CORONA)
+    ):
+        for phrase in ws:
+            m.add(phrase, label)
     
-    for i in dictn:
-        if dictn[i] == val:
-            return i
+    for phrase in WS_RANKING:
+        m.add(phrase, "ranking", CovidReport.TOP)
     
-    logger.error(f"getfirstkey: Value {str(val)} doesn't exist in dictionary.")
-    return ""
+    for form, val in LOCATION_INDEX.forms():
+        m.add(form, "location", val)
+    
+    m.compile()
+    
+    return m
 
 
-def get_phrases(ls):
-    """Get the set of phrases made by combining the strings in the given list.
-    
-    A phrase is obtained by concatenating any number of words in given order and
-    without skipping any of them.
-    Thus, if the given list has n words, the number of "phrases" possible is
-    (n(n+1))/2.
+def build_stemmer():
+    """Make the TurkishStemmer of the message words, for KEYWORD_MATCHER.
+    
+    Words are stemmed into the single word entries of the word sets and the
+    words of the location names. The other words of the word set phrases
+    (e.g. "misin" of "gönderir misin") do not take suffixes, and neither do
+    the words of WS_REQUEST, as their forms are listed in it instead (e.g.
+    "atarsın" is not a request). The words of WS_NOSTEM are kept as they are.
     """
-    r = set()
-    len_ls = len(ls)
-    
-    for i in range(len_ls):
-        phrase = ""
-        for j in range(i, len_ls):
-            if j != i: phrase += " "
-            phrase += ls[j]
-            
-            r.add(phrase)
     
-    return r
+    stems = {
+        i for ws in (WS_KIWO, WS_GROUP, WS_GREET, WS_WHATSUP, WS_CORONA,
+                     WS_RANKING)
+        for i in ws if len(i.split()) == 1
+    }
+    stems.update(w for form, _ in LOCATION_INDEX.forms() for w in form.split())
     
+    return TurkishStemmer(
+        KEYWORD_MATCHER.words() | WS_NOSTEM, stems | WS_NOSTEM
+    )
+
 
 def get_preposition(inp, apos=True):
     """Return the given string with the Turkish preposition "de/da" appended.
@@ -139,13 +3076,13 @@ def get_preposition(inp, apos=True):
     if apos: suffix += "'"
     
     for j in inp[::-1]:
-        if j in ["f", "s", "t", "k", "ç", "ş", "h", "p"]:
+        if j in HARD_CONSONANTS:
             harden = True
-        elif j in ["a", "ı", "o", "u"]:
+        elif j in BACK_VOWELS:
             suffix += ("ta" if harden else "da")
             
             return inp + suffix
-        elif j in ["e", "i", "ö", "ü"]:
+        elif j in FRONT_VOWELS:
             suffix += ("te" if harden else "de")
             
             return inp + suffix
@@ -155,19 +3092,100 @@ def get_preposition(inp, apos=True):
 
 
 def lower_tr(s):
-    """Call str.lower, but convert 'I' to 'ı' instead of 'i'.
+    """Call str.lower, but convert 'I' to 'ı' and 'İ' to 'i'.
     
     This is done to adhere to the Turkish alphabet.
     """
     
-    r = ""
-    for i in s:
-        if i == "I":
-            r += "ı"
+    return s.replace("I", "ı").replace("İ", "i").lower()
+
+
+def char_class(chars, gap=1):
+    """Return a regular expression character class matching any of chars.
+    
+    Characters closer than gap to each other are merged into ranges, as a
+    long class of single characters is slow to match. If gap is more than 1,
+    the class also matches the characters in between.
+    """
+    
+    ranges = []
+    for i in sorted(ord(c) for c in chars):
+        if ranges and i <= ranges[-1][1] + gap:
+            ranges[-1][1] = i
         else:
-            r += i.lower()
+            ranges.append([i, i])
+    
+    return "[" + "".join(
+        re.escape(chr(a)) + ("-" + re.escape(chr(b)) if b > a else "")
+        for a, b in ranges
+    ) + "]"
+
+
+def emoji_lengths(emojis):
+    """Return the lengths of the emojis starting with each character, the
+    longest first."""
+    
+    lengths = dict()
+    for i in emojis:
+        lengths.setdefault(i[0], set()).add(len(i))
+    
+    return {k: sorted(v, reverse=True) for k, v in lengths.items()}
+
+
+def normalise(text):
+    """Reduce a message text to its words, in a single pass over the text.
+    
+    "Reduced" means lowercase (see lower_tr) with removed emoji and
+    punctuations. Return a NormalisedText with:
+        text: The reduced words joined with spaces
+        words: The reduced words, followed by one of each used emoji type
+        candidates: words, but with a tuple of both lowercase forms in place
+            of the words which had an 'I' in them, as it is 'i' when Turkish
+            letters are not used (e.g. "KIWO"). To be scanned by
+            PhraseMatcher.
+        emojis: Distinct emojis in the text, in the order they are first used
+    """
+    
+    emojis = []
+    stripped = text
+    
+    # Emojis are removed in the same scan they are collected. (Skipped for
+    #   ASCII texts, as they can not have any.)
+    if not text.isascii():
+        parts = []
+        end = 0
+        
+        for match in EMOJI_START.finditer(text):
+            start = match.start()
+            
+            if start < end:  # Inside the last found emoji
+                continue
+            
+            # The longest emoji starting here, if any:
+            for length in EMOJI_LENGTHS.get(match.group(), ()):
+                if text[start:start + length] in EMOJIS:
+                    parts.append(text[end:start])
+                    emojis.append(text[start:start + length])
+                    end = start + length
+                    break
+        
+        stripped = " ".join(parts + [text[end:]])
+        emojis = list(dict.fromkeys(emojis))
+    
+    words = lower_tr(PUNCTUATION_PATTERN.sub("", stripped)).split()
+    candidates = words + emojis
     
-    return r
+    if "I" in stripped:
+        # The same words, with 'I' converted to 'i' this time:
+        alternatives = lower_tr(
+            PUNCTUATION_PATTERN.sub("", stripped.replace("I", "i"))
+        ).split()
+        
+        candidates = [
+            (w, a) if w != a else w for w, a in zip(words, alternatives)
+        ] + emojis
+    
+    return NormalisedText(" ".join(words), words + emojis, candidates, emojis)
 
 
 def datetime_format(date, caller=None):
@@ -187,16 +3205,67 @@ def datetime_format(date, caller=None):
     return date.strftime("%d.%m.%Y")
 
 
+def split_message(text, limit=MAX_MESSAGE_LENGTH):
+    """Split text into parts fitting in a message, at line breaks if possible.
+    """
+    
+    parts = []
+    
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        
+        if cut <= 0:
+            # No line break to split at, split in the middle of the line
+            parts.append(text[:limit])
+            text = text[limit:]
+        else:
+            parts.append(text[:cut])
+            text = text[cut + 1:]
+    
+    parts.append(text)
+    
+    return parts
+
+
+def run_blocking(update, context, func, *args):
+    """Call func with args, a part of a handler which may block (e.g. waiting
+    for a download).
+    
+    On the asyncio runtime (see AsyncRuntime), func is called on a thread of
+    the loop's default executor instead, so that the handlers of the other
+    chats are not held up. Its exceptions go to the error handlers, as the
+    ones of a handler would. (The calls of an AsyncBot can be made from any
+    thread.)
+    """
+    
+    if not isinstance(context.bot, AsyncBot):
+        func(*args)
+        return
+    
+    def call():
+        try:
+            func(*args)
+        except Exception as e:
+            context.dispatcher.dispatch_error(update, e)
+    
+    context.bot.loop.run_in_executor(None, call)
+
+
 def send_action(act):
-    """Wrapper for sending an action to the user while handling a request."""
+    """Wrapper for sending an action to the user while handling a request.
+    
+    The action is scheduled without waiting for it, and is not sent again to a
+    chat in which it is still shown (see recent_actions), e.g. when corona is
+    called for several locations of a message.
+    """
     
     def decorator(func):
         @wraps(func)
         def command_func(update, context, *args, **kwargs):
-            context.bot.send_chat_action(
-                chat_id=update.effective_chat.id,
-                action=act
-            )
+            chat_id = update.effective_chat.id
+            
+            if recent_actions.set_new((chat_id, act), True) is None:
+                context.bot.send_chat_action(chat_id=chat_id, action=act)
             
             return func(update, context, *args, **kwargs)
         
@@ -205,39 +3274,300 @@ def send_action(act):
     return decorator
 
 
+def guess_note(words, guesses):
+    """Return the message telling which words were taken as which location
+    names, for the guesses of LocationIndex.guess."""
+    
+    return "\n".join(
+        f'"{" ".join(words[start:end])}" yazdığını'
+        f" {LOCATION_INDEX.display_name(i)} olarak anladım."
+        for start, end, i in guesses
+    )
+
+
+def suggestion_note(suggestions):
+    """Return a sentence suggesting the location names of
+    LocationIndex.guess, to be appended to a message. Empty if there are
+    none."""
+    
+    if not suggestions:
+        return ""
+    
+    names = ", ".join(LOCATION_INDEX.display_name(i) for i in suggestions)
+    
+    # (The question particle follows the vowel harmony of the last name.)
+    return f" yoksa {names} {TurkishStemmer.attach(names, 'mI')} demek" \
+        " istedin?"
+
+
+def covid_dataset(location):
+    """Return the COVID dataset to look up a canonical location name in."""
+    
+    return "us" if location == "US" else "global"
+
+
+def covid_summary(location, date, totals, changes=None):
+    """Return the corona reply paragraph of a location with the CovidTotals
+    from the report of date (in "%m-%d-%Y" format), and the CovidChanges of the
+    day if given."""
+    
+    case, active, recoveries, deaths = totals
+    
+    logger.info(
+        f"Got case: {case}, active: {active}, recoveries: {recoveries},"
+        f" deaths: {deaths}"
+    )
+    
+    if location == "United Kingdom":
+        location_text = "birleşik krallık'ta"
+    else:
+        location_text = get_preposition(LOCATION_INDEX.display_name(location))
+    
+    text = datetime_format(dt.datetime.strptime(date, "%m-%d-%Y")) \
+        + f" itibariyle {location_text} toplam {case:,} resmi vaka olmuş." \
+        f"\nverilere göre bunlardan {active:,} tanesi aktif." \
+        f"\ngeri kalan kişilerin {deaths:,} tanesi hayatını kaybetmiş," \
+        f" {recoveries:,} tanesi iyileşmiş.\n"
+    
+    if changes is not None and changes.new_cases is not None:
+        text += f"bir önceki güne göre {changes.new_cases:,} yeni vaka," \
+            f" {changes.new_deaths:,} yeni ölüm var.\n"
+        
+        if changes.average_cases is not None:
+            text += "son bir haftada günde ortalama" \
+                f" {changes.average_cases:,.0f} vaka," \
+                f" {changes.average_deaths:,.0f} ölüm görülmüş.\n"
+    
+    if not recoveries:
+        text += "0 iyileşen kötüymüş be. ülkenin henüz tüm verileri" \
+            + " sunmuyor olma ihtimali yüksek.\n"
+    
+    return text
+
+
+def covid_ranking(dataset, date, report):
+    """Return the corona reply paragraph of the countries with the most new
+    cases in the CovidReport of the dataset for date (see
+    CovidHistory.top_new_cases). If the counts of the day before are not
+    known, the countries with the most cases in total (see CovidReport.top)
+    are listed instead."""
+    
+    day = datetime_format(dt.datetime.strptime(date, "%m-%d-%Y"))
+    
+    def name_of(country):
+        return LOCATION_INDEX.display_name(country) \
+            if country in LOCATION_INDEX else country
+    
+    ranked = covid_history.top_new_cases(
+        dataset, date,
+        [i for i in report.totals if i not in report.aggregates],
+        CovidReport.TOP_COUNT
+    )
+    
+    if ranked:
+        lines = [day + " itibariyle en çok yeni vaka görülen ülkeler:"]
+        
+        for rank, (country, new_cases) in enumerate(ranked, start=1):
+            totals = report.get(country)
+            
+            lines.append(
+                f"{rank}. {name_of(country)}: {new_cases:+,} vaka (toplam"
+                f" {totals.confirmed:,} vaka, {totals.deaths:,} ölüm)"
+            )
+        
+        return "\n".join(lines) + "\n"
+    
+    lines = [day + " itibariyle en çok vaka görülen ülkeler:"]
+    
+    for rank, (country, totals) in enumerate(report.top, start=1):
+        lines.append(
+            f"{rank}. {name_of(country)}: {totals.confirmed:,} vaka,"
+            f" {totals.deaths:,} ölüm"
+        )
+    
+    return "\n".join(lines) + "\n"
+
+
+def covid_update(dataset, now, force=False):
+    """Make sure the newest available report of a COVID dataset is on disk.
+    
+    The candidates are the date of the datetime.datetime object 'now' and the
+    4 days before it. If a newer version of the report is downloaded, its
+    cached parsed version is invalidated. If force is True, the newest date is
+    probed and the report is revalidated even if it was done recently.
+    
+    Return the date of the found report as formatted for corona, or None.
+    """
+    
+    dates = [datetime_format(now - dt.timedelta(i), "corona") for i in range(5)]
+    date = covid_fetcher.resolve_latest(dataset, dates, force=force)
+    
+    if date is None:
+        logger.info(f"No {dataset} report found for the last 5 days.")
+        return None
+    
+    status = covid_fetcher.fetch(dataset, date, force=force)
+    
+    if status == CovidFetcher.MISSING:
+        return None
+    
+    if status == CovidFetcher.DOWNLOADED:
+        # The parsed version of the previous file is outdated now:
+        covid_reports.invalidate(dataset, date)
+    
+    return date
+
+
+def covid_latest_report(dataset, now):
+    """Return the (date, CovidReport) pair of the newest report of a COVID
+    dataset for the datetime.datetime object 'now', or None if there is no
+    report of the last 5 days (see covid_update).
+    
+    The prefetched report (see covid_prefetch) is used if it is one of those.
+    If its file is gone (see db_cleanup) while it is not cached, the report is
+    fetched again. May raise pd.errors.ParserError.
+    """
+    
+    dates = [datetime_format(now - dt.timedelta(i), "corona") for i in range(5)]
+    
+    date = covid_reports.latest(dataset)
+    
+    if date not in dates:
+        date = covid_update(dataset, now)
+    
+    if date is None:
+        return None
+    
+    try:
+        return date, covid_reports.get(
+            dataset, date, covid_fetcher.path(dataset, date)
+        )
+    except OSError as e:
+        logger.warning(f"Could not read COVID {dataset} csv of {date}: {e}")
+    
+    date = covid_update(dataset, now)
+    
+    if date is None:
+        return None
+    
+    return date, covid_reports.get(
+        dataset, date, covid_fetcher.path(dataset, date)
+    )
+
+
+def covid_prefetch(context):
+    """Get the newest COVID reports on disk and parsed before they're asked.
+    
+    Run periodically, so that corona can reply using the prefetched reports
+    without waiting for the network.
+    """
+    
+    logger.info("Executing covid_prefetch.")
+    
+    for dataset in CovidFetcher.DATASETS:
+        date = covid_update(dataset, dt.datetime.utcnow(), force=True)
+        
+        if date is None:
+            logger.warning(f"covid_prefetch found no {dataset} report.")
+            continue
+        
+        try:
+            covid_reports.get(
+                dataset, date, covid_fetcher.path(dataset, date)
+            )
+        except pd.errors.ParserError:
+            logger.error(f"Couldn't parse COVID {dataset} csv of {date}!")
+            continue
+        
+        covid_reports.set_latest(dataset, date)
+        covid_backfill(dataset, date)
+    
+    logger.info("Exiting covid_prefetch.")
+
+
+def covid_backfill(dataset, date):
+    """Ingest the reports of the days before date which are needed for the
+    daily changes (see CovidHistory.changes) but are not ingested yet.
+    
+    The reports are parsed for covid_history only, they are not cached. Once
+    ingested, a report is not downloaded again.
+    """
+    
+    day = dt.datetime.strptime(date, "%m-%d-%Y")
+    
+    for i in range(1, CovidHistory.AVERAGE_DAYS + 1):
+        past = datetime_format(day - dt.timedelta(i), "corona")
+        
+        if covid_history.has(dataset, past) or \
+                covid_fetcher.fetch(dataset, past) == CovidFetcher.MISSING:
+            continue
+        
+        try:
+            covid_history.ingest(
+                dataset, past,
+                CovidReport.from_csv(
+                    covid_fetcher.path(dataset, past), COVID_REGIONS
+                )
+            )
+        except pd.errors.ParserError:
+            logger.error(f"Couldn't parse COVID {dataset} csv of {past}!")
+
+
 # Chat database maintenance func.s: #
 
-def db_add(src_path, db, new_entry):
-    """Adds a string entry to a database file and the given set variable.
+def db_add(src_path, db, new_entry, chat_type=None):
+    """Adds an entry to a chat database file and the given set variable.
     
+    The change is recorded through the storage of the file, see the
+    chat_stores global. chat_type is the type of the chat, if known.
     If it already exists in the set, do not take any action.
     """
     
-    if new_entry not in db:
-        with open(src_path, "r+") as f:
-            f.seek(0, 2)
-            f.write(str(new_entry) + "\n")
-            f.seek(0)
-        
-        db.add(new_entry)
+    if chat_stores[src_path].add(db, new_entry, chat_type=chat_type):
+        backup_scheduler.record("+", src_path, new_entry)
 
 
 def db_remove(src_path, db, chat_id):
-    """Removes a string entry from a database file and the given set variable.
+    """Removes an entry from a chat database file and the given set variable.
     
+    The change is recorded through the storage of the file, see the
+    chat_stores global.
     If it does not already exist in the set, do not take any action.
     """
     
-    if chat_id in db:
-        with open(src_path, "r+") as f:
-            l = f.readlines()
-            f.seek(0)
-            for i in l:
-                if i != (str(chat_id) + "\n"):
-                    f.write(i)
-            f.truncate()
-        
-        db.remove(chat_id)
+    if chat_stores[src_path].remove(db, chat_id):
+        backup_scheduler.record("-", src_path, chat_id)
+
+
+def db_recipients():
+    """Return the chats to send announcements to."""
+    
+    # The sets may be changed by the handlers of other chats meanwhile (see
+    #   OrderedDispatcher), so they are copied with the locks of their stores:
+    return chat_stores[PATH_CHATS].copy(db_chats) \
+        - chat_stores[PATH_ANNC_BLIST].copy(db_annc_blist)
+
+
+def db_sync(context):
+    """fsync the pending records of the chat databases."""
+    
+    for i in chat_stores.values():
+        i.sync()
+
+
+def state_snapshot(context):
+    """Drop the expired chat states and write the rest to their snapshots.
+    (recent_actions is only purged, it has no snapshot.)"""
+    
+    for i in (dict_chat_states, dict_annc_temp, recent_actions):
+        i.purge()
+        i.snapshot()
+
+
+def filter_report(context):
+    """Log how many of the incoming messages MESSAGE_FILTER dropped."""
+    
+    logger.info(MESSAGE_FILTER.report())
 
 
 def db_cleanup(context):
@@ -259,20 +3589,25 @@ def db_cleanup(context):
     # /corona files: #
     # Cleans up COVID data older than 2 days.
     
+    # (The ".meta" files hold the HTTP headers of the report with the same
+    #   date, see CovidFetcher.)
+    
     for f in os.scandir(PATH_COVID_DIR):
         fname = f.name
         
-        # f.name[:-4] strips the file extension:
-        if (fname.endswith(".csv") and
-            (now - dt.datetime.strptime(fname[:-4], "%m-%d-%Y")).days > 2):
+        # fname.split(".")[0] strips the file extension:
+        if (fname.endswith((".csv", ".csv.meta")) and
+            (now - dt.datetime.strptime(fname.split(".")[0], "%m-%d-%Y")).days
+                > 2):
             logger.info("Removing from " + PATH_COVID_DIR + f": {fname}")
             os.remove(f)
         
     # (Repeat with us_data/ dir:)
     for f in os.scandir(PATH_COVID_DIR + "us_data/"):
         fname = f.name
-        if (fname.endswith(".csv") and
-            (now - dt.datetime.strptime(fname[:-4], "%m-%d-%Y")).days > 2):
+        if (fname.endswith((".csv", ".csv.meta")) and
+            (now - dt.datetime.strptime(fname.split(".")[0], "%m-%d-%Y")).days
+                > 2):
             logger.info(
                 "Removing from " + PATH_COVID_DIR + f"us_data/: {fname}"
             )
@@ -336,54 +3671,120 @@ def db_read(src_path, read_type=set, read_int=False):
     return result
 
 
-# For now, this backup function is manually called in the code after every
-#   database update. If the user base grows and the backups get too
-#   overwhelming, the manual calls can be removed and the func. can be called
-#   automatically in a specific time interval instead.
-@send_action(ChatAction.UPLOAD_DOCUMENT)
-def db_backup(update, context, called_with_message=True):
-    """Send a temporary db. backup zip file to the administrators.
+def msg_read(src_path):
+    """Read the whole text of a message file (see the Message strings)."""
     
-    The administrator chat IDs are listed under the DB_ADMIN_CHATS global.
+    with open(src_path, "r") as f:
+        return f.read()
+
+
+def db_admin_groups():
+    """Return the administrator group chats, to send the backups to."""
     
-    If the bot calls this function by itself, send the message only to the
-    administrator group chats. In this case, called_with_message
-    flag must be set to False.
+    # NOTE: The conditional below relies on the negative chat ID property of
+    #   groups. Keep in mind that this property is not officially defined and
+    #   may be subject to change.
+    return [i for i in DB_ADMIN_CHATS if i < 0]
+
+
+def db_backup_name(kind=""):
+    """Return a unique file name (without extension) for a backup file."""
     
-    If an administrator calls this function through the /db_backup command in an
-    administrator chat, the file is sent only to that chat.
+    return "chat_data_" + kind + ("DEPLOYED_" if DEPLOYED else "LOCAL_") \
+        + datetime_format(dt.datetime.now(), "db_backup") + "_" \
+        + uuid4().hex[:8]
+
+
+def db_read_all():
+    """Read every file in the chat data directory.
+    
+    Return a list of (path relative to the directory, contents) pairs in a
+    fixed order, and the SHA-256 hash of all of them.
     """
     
-    # TODO: Do not run if DB_ADMIN_CHATS is empty
+    if chat_db is not None:
+        # Make the database file self-contained before reading it:
+        chat_db.checkpoint()
     
-    if called_with_message and (update.effective_chat.id not in DB_ADMIN_CHATS):
-        update.message.reply_text("yalnızca admin chatlerde!")
+    files = []
+    digest = hashlib.sha256()
+    
+    for root, dirs, names in os.walk(PATH_CHAT_DATA_DIR):
+        dirs.sort()
+        
+        for i in sorted(names):
+            path = os.path.join(root, i)
+            
+            with open(path, "rb") as f:
+                data = f.read()
+            
+            arcname = os.path.relpath(path, PATH_CHAT_DATA_DIR)
+            files.append((arcname, data))
+            
+            digest.update(arcname.encode() + b"\0")
+            digest.update(hashlib.sha256(data).digest())
+    
+    return files, digest.hexdigest()
+
+
+def db_send_archive(bot, chats, force=True):
+    """Send a zip file of the chat data directory to the given chats.
+    
+    The archive is made in memory. If force is False and the contents of the
+    directory are the same as in the last archive sent, nothing is sent.
+    """
+    
+    global last_archive_hash
+    
+    files, content_hash = db_read_all()
+    
+    if not force and content_hash == last_archive_hash:
+        logger.info("Chat data is unchanged since the last archive, skipping.")
         return
     
-    zipname = "chat_data_" + ("DEPLOYED_" if DEPLOYED else "LOCAL_") \
-        + datetime_format(dt.datetime.now(), "db_backup") + "_" \
-        + uuid4().hex[:8]
+    zipname = db_backup_name()
+    
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(
+        buffer, "w", zipfile.ZIP_DEFLATED, compresslevel=BACKUP_COMPRESSLEVEL
+    ) as z:
+        for arcname, data in files:
+            z.writestr(arcname, data)
+    
+    data = buffer.getvalue()
     
-    logger.info("Beginning .zip creation in db_backup.")
-    zippath = shutil.make_archive(
-        PATH_CACHE_DIR + zipname, "zip", PATH_CHAT_DATA_DIR, logger=logger
+    logger.info(
+        f"Sending {zipname}.zip ({len(data)} bytes) to {len(chats)} chats."
     )
     
-    with open(zippath, "rb") as z:
-        chat = update.effective_chat.id
-        
-        if called_with_message and (chat in DB_ADMIN_CHATS):
-            context.bot.send_document(chat, z, filename=zipname + ".zip")
-        else:
-            for i in DB_ADMIN_CHATS:
-            # NOTE: The conditional below relies on the negative chat ID
-            #   property of groups. Keep in mind that this property is not
-            #   officially defined and may be subject to change.
-                if i < 0:
-                    context.bot.send_document(i, z, filename=zipname + ".zip")
+    for i in chats:
+        bot.send_document(
+            i,
+            io.BytesIO(data),
+            filename=zipname + ".zip",
+            priority=OutboundScheduler.BACKGROUND
+        )
     
-    os.remove(zippath)
-    logger.info("Removed the temporary .zip. Exiting db_backup.")
+    last_archive_hash = content_hash
+
+
+# The database changes are backed up automatically by backup_scheduler (see
+#   BackupScheduler), this function is for the /db_backup command.
+@send_action(ChatAction.UPLOAD_DOCUMENT)
+def db_backup(update, context):
+    """Send a temporary db. backup zip file to the administrators.
+    
+    The administrator chat IDs are listed under the DB_ADMIN_CHATS global.
+    
+    If an administrator calls this function through the /db_backup command in an
+    administrator chat, the file is sent only to that chat.
+    """
+    
+    if update.effective_chat.id not in DB_ADMIN_CHATS:
+        update.message.reply_text("yalnızca admin chatlerde!")
+        return
+    
+    db_send_archive(context.bot, [update.effective_chat.id])
 
 
 # Custom message sending functions: #
@@ -403,10 +3804,15 @@ def notify_admins(context, message, groups_only=True):
     if groups_only:
         for i in DB_ADMIN_CHATS:
             if i < 0:
-                context.bot.send_message(i, message, isgroup=True)
+                context.bot.send_message(
+                    i, message, isgroup=True,
+                    priority=OutboundScheduler.BACKGROUND
+                )
     else:
         for i in DB_ADMIN_CHATS:
-            context.bot.send_message(i, message, isgroup=(i < 0))
+            context.bot.send_message(
+                i, message, priority=OutboundScheduler.BACKGROUND
+            )
 
 
 def greet(update, context):
@@ -436,10 +3842,7 @@ def start(update, context):
     
     if chat_id not in db_chats:
         # Add chat ID to database (and thus to the announcement list):
-        db_add(PATH_CHATS, db_chats, chat_id)
-        # Manual backup of the updated chat data. Change if becomes too
-        #   overwhelming:
-        db_backup(update, context, called_with_message=False)
+        db_add(PATH_CHATS, db_chats, chat_id, update.effective_chat.type)
     
     update.message.reply_markdown_v2(MSG_START)
 
@@ -452,7 +3855,6 @@ def help_info(update, context):
     update.message.reply_markdown_v2(MSG_HELP)
 
 
-# FIXME: does ri_set convert İ to i? I should be converted both to i and to ı.
 # TODO: When asked, tell the user his/her ID
 # TODO: When asked, tell the user the chat's ID
 def read_incoming(update, context):
@@ -471,42 +3873,11 @@ def read_incoming(update, context):
     #   when they are executed in the same message.
     
     global dict_last_anncs
-    global dict_annc_temp
+    global last_broadcast
     
     # Incoming message object:
     inc = update.message
     
-    # List of detected distinct emojis in message text:
-    emojis = emoji.distinct_emoji_lis(inc.text)
-    
-    # Reduced and splitted versions of incoming message:
-    #   "Reduced" means lowercase with removed emoji and punctuations.
-    #   The set also includes potential phrases to check, formed by conscutive
-    #   and non-skipped combinations of words. For example: 
-    #   If inc is "A, b C", ri_set is {"a", "a b", "a b c", "b", "b c", "c"}.
-    
-    # Lower and remove punctuations:
-    red_inc = lower_tr(
-        inc.text.translate(str.maketrans('', '', string.punctuation))
-    )
-    # Remove emojis:
-    for i in emojis:
-        red_inc = red_inc.replace(i, "")
-    
-    ri_list = red_inc.split()
-    
-    len_ri_list = len(ri_list)
-    word_limit = len_ri_list if len_ri_list < 50 else 50
-    
-    # ri_set is used for keyword recognition in incoming messages.
-    # (If the message is too long, it may be inefficient to work with n(n+1)/2
-    #   elements. Thus, only the first 50 words of a message are read.)
-    ri_set = get_phrases(ri_list[:word_limit])
-    
-    # Add one of each used emoji type to ri_set:
-    for i in emojis:
-        ri_set.add(i)
-    
     chat_is_private = (inc.chat.type == "private")
     chat_id = inc.chat.id
     replied_to = inc.reply_to_message
@@ -516,10 +3887,32 @@ def read_incoming(update, context):
         (replied_to is not None)
         and replied_to.from_user.id == BOT_ID
     )
+    
+    # Fast path for the (group) messages which can not get any reply: #
+    #   Anything else than a private chat, a reply to the bot or a chat in a
+    #   state is only replied to if it has a word of MESSAGE_FILTER.
+    if chat_is_private or is_reply_to_bot or chat_id in dict_chat_states:
+        MESSAGE_FILTER.skip()
+    elif not MESSAGE_FILTER.passes(inc.text):
+        return
+    
+    # Reduced and splitted versions of incoming message, see normalise:
+    normalised = normalise(inc.text)
+    red_inc = normalised.text
+    
+    # One of each used emoji type is appended to the words:
+    ri_list = normalised.words
+    
+    # Keyword recognition in the whole message, in a single pass over the
+    #   stems of the words. See build_keyword_matcher for the labels of the
+    #   hits.
+    ri_hits = KEYWORD_MATCHER.scan(STEMMER.stem_all(normalised.candidates))
+    
     targeted_to_bot = (
         chat_is_private
         or is_reply_to_bot
-        or (ri_set & (WS_KIWO | WS_GROUP))
+        or ("kiwo" in ri_hits)
+        or ("group" in ri_hits)
     )
     
     ## Dispatching block: ##
@@ -571,12 +3964,17 @@ def read_incoming(update, context):
                 logger.debug("Non-admin: Exit announce_lv1")
                 reply_with("yalnız adminler duyuru yollayabilir!")
             else:
-                if red_inc in {"evet", "yes"}:
-                    logger.info(
-                        "Beginning mass announcement: Sending to every"
-                        " non-blacklisted chat in the database."
+                annc = dict_annc_temp.get(chat_id)
+                
+                if annc is None:
+                    # The buffered message expired before the confirmation
+                    reply_with(
+                        "duyuru mesajı çok bekletildiği için silindi. duyuru"
+                        " yapmak için /duyur ile baştan başlayın."
                     )
                     
+                    dict_chat_states.pop(chat_id)
+                elif red_inc in {"evet", "yes"}:
                     reply_with(
                         "tamamdır, duyuruları göndermeye başlıyorum. bir"
                         " aksilik söz konusu olursa dediğim gibi /duyurusil ile"
@@ -589,40 +3987,20 @@ def read_incoming(update, context):
                         " başlandı..."
                     )
                     
-                    dict_last_anncs = dict()
-                    
-                    recipients = db_chats - db_annc_blist
-                    
-                    # The message is guaranteed to exist in the buffer:
-                    annc = dict_annc_temp[chat_id]
-                    
-                    # Send to every recipient, log and fill dict_last_anncs in
-                    #   the process
-                    
-                    for i in recipients:
-                        # NOTE: The isgroup argument below relies on the
-                        #   negative chat ID property of groups. Keep in
-                        #   mind that this property is not officially
-                        #   defined and may be subject to change.
-                        sent = context.bot.send_message(
-                            i,
-                            annc,
-                            isgroup=(i < 0)
-                        )
-                        
-                        # sent is a telegram.utils.promise.Promise object
-                        
-                        dict_last_anncs[i] = sent.result().message_id
-                        
-                        logger.info(
-                            f"Announcement sent to recipient ID {i} with"
-                            f" message ID {dict_last_anncs[i]}"
-                        )
-                    
-                    del dict_annc_temp[chat_id]
-                    del dict_chat_states[chat_id]
+                    # Send to every non-blacklisted chat in the database on the
+                    #   broadcast's own thread, which also fills
+                    #   dict_last_anncs in the process:
+                    last_broadcast = Broadcast.create(
+                        PATH_LAST_ANNC,
+                        annc,
+                        db_recipients(),
+                        chat_id
+                    )
+                    dict_last_anncs = last_broadcast.delivered
+                    last_broadcast.start(context.bot)
                     
-                    logger.info("Finished mass announcement.")
+                    dict_annc_temp.pop(chat_id)
+                    dict_chat_states.pop(chat_id)
                 elif red_inc in {"hayır", "no"}:
                     reply_with(
                         "peki, yeni duyuru mesajı için bekliyorum. duyuru"
@@ -642,7 +4020,7 @@ def read_incoming(update, context):
                 " hiçbir şey olmamış gibi yazışmaya devam edebiliriz."
             )
             
-            del dict_chat_states[chat_id]
+            dict_chat_states.pop(chat_id)
             
             logger.warning(
                 f"read_incoming called with unknown state: {state} - State is"
@@ -664,76 +4042,59 @@ def read_incoming(update, context):
     
     if targeted_to_bot:
         # Replies for when the bot but NOT any other group member is targeted: #
-        if ri_set.isdisjoint(WS_GROUP):
+        if "group" not in ri_hits:
             # Currently unused
             pass
         # Replies for when the bot OR any other group member is targeted: #
         # Responding to a personal or general group greeting:
-        if ri_set & WS_GREET:
+        if "greet" in ri_hits:
             greet(update, context)
         
         # Responding to a personal or general group "what's up?":
-        if ri_set & WS_WHATSUP:
+        if "whatsup" in ri_hits:
             reply_with(choose_one(LIST_WHATSUP_REPLY))
         
         # Detecting command requests: #
-        if chat_is_private or (ri_set & WS_REQUEST):
+        if chat_is_private or ("request" in ri_hits):
             # /corona:
-            # FIXME: "papua yeni gine" triggers for both "gine" and "papua yeni
-            #   gine".
-            if ri_set & WS_CORONA:
-                locations = set()
-                key_set = set(DICT_LOCATIONS.keys())
-                val_set = set(DICT_LOCATIONS.values())
+            if "corona" in ri_hits:
+                locations = []
+                
+                # Words of the message which are part of a known phrase, for
+                #   leftover detection:
+                known = ri_hits.covered(
+                    {"corona", "request", "kiwo", "greet", "whatsup"}
+                )
                 
-                # Stripped input message for leftover detection
-                exclude = (WS_CORONA
-                        | WS_REQUEST
-                        | WS_KIWO
-                        | WS_GREET
-                        | WS_WHATSUP)
+                # Found location names, longest ones taking precedence, and
+                #   the requests of the ranking:
+                found = LOCATION_INDEX.resolve(ri_hits) \
+                    + LOCATION_INDEX.resolve(ri_hits, "ranking")
+                for start, end, i in found:
+                    known.update(range(start, end))
                 
-                for phrase in ri_set:
-                    compare = {phrase}
-                    if phrase.endswith("da") or phrase.endswith("de") \
-                            or phrase.endswith("ın") or phrase.endswith("in"):
-                        compare.add(phrase[:-2])
-                    if phrase.endswith("nde") or phrase.endswith("nde") \
-                            or phrase.endswith("nın") \
-                            or phrase.endswith("nin"):
-                        compare.add(phrase[:-3])
-                    
-                    for i in compare:
-                        # Do not break when found, compare set may hold multiple
-                        #   keys
-                        if i in key_set:
-                            # Check for a translated location name in message
-                            if DICT_LOCATIONS[i] not in locations:
-                                locations.add(DICT_LOCATIONS[i])
-                            exclude |= get_phrases(phrase.split())
-                        elif i in val_set:
-                            # Check for the original location name in message
-                            if i not in locations:
-                                locations.add(i)
-                            exclude |= get_phrases(phrase.split())
+                # Misspelled location names among the rest:
+                guesses, suggestions = LOCATION_INDEX.guess(ri_list, known)
+                for start, end, i in guesses:
+                    known.update(range(start, end))
                 
-                # Excluding phrases that contain excluded words. The previous
-                #   loop must be completed first.
-                for phrase in ri_set:
-                    for i in phrase.split():
-                        if i in exclude and phrase not in exclude:
-                            exclude.add(phrase)
-                            break
+                for start, end, i in sorted(found + guesses):
+                    if i not in locations:
+                        locations.append(i)
+                
+                if guesses:
+                    reply_with(guess_note(ri_list, guesses))
                 
-                if ri_set - exclude:  # Inform user about unknown words
+                if len(known) < len(ri_list):  # Inform about unknown words
                     reply_with(
                         "mesajda ülke ismi olarak tanıyamadığım kelimeler var."
                         " doğru yazılmış bir ülke ismini tanıyamadıysam lütfen"
                         " o kelimedeki ekleri çıkarıp tekrar dene."
+                        + suggestion_note(suggestions)
                     )
                 elif not locations:
                     # No location names detected, default to "Turkey"
-                    locations.add("Turkey")
+                    locations.append("Turkey")
                 
                 if locations:
                     logger.info(
@@ -741,30 +4102,31 @@ def read_incoming(update, context):
                     )
                     reply_with("hemen bakıyorum...")
                     
-                    for i in locations:
-                        corona(update, context, i)
+                    corona(update, context, locations)
     else:  # Not targeted_to_bot
         # Detecting and responding to a group greeting with keywords:
         if red_inc in ["selamlar", "merhabalar"]:
             greet(update, context)
         
         # Detecting and responding to a group "what's up?" with keyword:
-        if ri_set & {"nabersiniz"}:
+        if "nabersiniz" in ri_list:
             reply_with(choose_one(LIST_WHATSUP_REPLY))
 
 
-# TODO: Also inform about the day's new stats
-# TODO: Should also support the world's total data
 @send_action(ChatAction.TYPING)
-def corona(update, context, location="Turkey"):
-    """Get the latest COVID-19 data of the requested location & present it.
+def corona(update, context, locations=("Turkey",)):
+    """Get the latest COVID-19 data of the requested locations & present it.
     
-    The location arg. must be a value of the dictionary DICT_LOCATIONS.
+    The locations arg. must be a list of canonical names in LOCATION_INDEX,
+    or CovidReport.TOP for the countries with the most cases.
+    The data of all the locations is sent in a single reply, read from a
+    single parsed report of each needed dataset.
     """
     
     reply_with = update.message.reply_text
     
-    if location not in DICT_LOCATIONS.values():
+    if any(i not in LOCATION_INDEX and i != CovidReport.TOP
+           for i in locations):
         logger.error("corona func. called with an invalid location name!")
         
         notify_admins(context, "corona fonk. da csv okunamadı!")
@@ -776,176 +4138,130 @@ def corona(update, context, location="Turkey"):
         
         return
     
-    global last_covid_get_date
+    if context.args:
+        # Every location named in the arg.s (and the ranking, if asked for),
+        #   in the order they are named:
+        normalised = normalise(" ".join(context.args))
+        hits = KEYWORD_MATCHER.scan(STEMMER.stem_all(normalised.candidates))
+        found = LOCATION_INDEX.resolve(hits) \
+            + LOCATION_INDEX.resolve(hits, "ranking")
+        
+        # Misspelled location names among the rest:
+        guesses, suggestions = LOCATION_INDEX.guess(
+            normalised.words,
+            {j for start, end, i in found for j in range(start, end)}
+        )
+        found = sorted(found + guesses)
+        
+        if sum(end - start for start, end, i in found) \
+                < len(normalised.words):
+            reply_with(
+                'ülke adını (henüz) bilmiyorum. "-da", "-de" gibi bir ek ya'
+                ' da özel karakterler mi kullandın? lütfen ekleri çıkarıp'
+                ' tekrar dene.' + suggestion_note(suggestions)
+            )
+            
+            return
+        
+        if guesses:
+            reply_with(guess_note(normalised.words, guesses))
+        
+        locations = list(dict.fromkeys(i for start, end, i in found))
+    
+    # Getting the reports may wait for a download:
+    run_blocking(update, context, corona_reply, update, context, locations)
+
+
+def corona_reply(update, context, locations):
+    """Send the corona reply of the locations (see corona). May block while
+    the reports are downloaded and parsed, see run_blocking."""
     
+    reply_with = update.message.reply_text
     msg_date = update.message.date
     chat_id = update.effective_chat.id
     chat_is_group = update.effective_chat.type != "private"
     
-    date = datetime_format(msg_date, "corona")
-    url_tries = 0
+    # The report of each needed dataset, read once for all the locations:
+    reports = dict()
     
-    if context.args:
-        # If there are multiple arg.s, only the first one is used.
-        # TODO: Should handle multiple arguments. Recursion implementation is
-        #   probably not worth it. Pass the arg.s to read_incoming?
-        
+    for dataset in {covid_dataset(i) for i in locations}:
         try:
-            location = DICT_LOCATIONS[lower_tr(context.args[0])]
-        except KeyError:
-            loc_candidate = context.args[0].capitalize()
-            if loc_candidate in DICT_LOCATIONS.values():
-                location = loc_candidate
-            else:
-                reply_with(
-                    'ülke adını (henüz) bilmiyorum. "-da", "-de" gibi bir ek ya'
-                    ' da özel karakterler mi kullandın? lütfen ekleri çıkarıp'
-                    ' tekrar dene.'
-                )
-                
-                return
-    
-    while url_tries < 5:
-        req_file_name = date + ".csv"
-        
-        if location == "US":
-            url = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19" \
-                + "/master/csse_covid_19_data/csse_covid_19_daily_reports_us/" \
-                + req_file_name
+            reports[dataset] = covid_latest_report(dataset, msg_date)
+        except (pd.errors.ParserError, OSError):
+            logger.error("Couldn't parse COVID database csv!")
             
-            req_file_path = PATH_COVID_DIR + "us_data/" + req_file_name
-        else:
-            # TODO: Is a separate URL for US really needed?
-            url = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19" \
-                + "/master/csse_covid_19_data/csse_covid_19_daily_reports/" \
-                + req_file_name
+            notify_admins(context, "corona fonk. da csv okunamadı!")
             
-            req_file_path = PATH_COVID_DIR + req_file_name
-        
-        # If requested file exists in database and enough time has passed since
-        #   last retrieval (In this case, 10800 seconds (3 hours)):
-        #   (Comparing seconds since datetime subtraction returns timedelta
-        #   object which only has days, sec.s and microsec.s stored internally)
-        
-        if (os.path.exists(req_file_path) and
-            (dt.datetime.now() - last_covid_get_date).seconds < 10800):
-            logger.info(
-                "Requested file has already been retrieved into the"
-                " database in the last 3 hours."
+            reply_with(
+                "acayip bir şeyler oldu, nedense elimdeki veritabanını"
+                " okuyamıyorum. bilgiyi aldığım kaynakta ya da direkt bende"
+                " bir yamukluk olabilir."
             )
-            break
-        else:  # If requested file doesn't exist or enough time has passed
-            data_response = requests.get(url)
             
-            if int(data_response.status_code) // 100 == 2:  # 2xx HTTP status
-                # Note that requests module handles 3xx (redirection) and issues
-                #   the new status code instead.
-                logger.info(f"Retrieved file from: {url}")
-                
-                with open(req_file_path, "wb") as f:
-                    f.write(data_response.content)
-                    logger.info("File written in database.")
-                
-                last_covid_get_date = dt.datetime.now()
-                
-                break
-            else:
-                # Making date var. one day earlier (getting prev. day of the
-                #   datetime.datetime object):
-                logger.info(
-                    f"Non-2xx HTTP response for {date} - trying to get the"
-                    " previous day's data."
-                )
-                
-                date = datetime_format(msg_date - dt.timedelta(1), "corona")
-                url_tries += 1
-    else:
-        reply_with(
-            "aradığım kaynağı ya 5 gündür güncellemiyorlar ya da komple"
-            " uçurdular. umarım salgın sona erdiği içindir ve bağlantımda bi"
-            " sorun yoktur."
-        )
-        return
-    
-    try:
-        df = pd.read_csv(req_file_path)
-    except pd.errors.ParserError:
-        logger.error("Couldn't parse COVID database csv!")
-        
-        notify_admins(context, "corona fonk. da csv okunamadı!")
-        
-        reply_with(
-            "acayip bir şeyler oldu, nedense elimdeki veritabanını"
-            " okuyamıyorum. bilgiyi aldığım kaynakta ya da direkt bende bir"
-            " yamukluk olabilir."
-        )
+            return
         
-        return
+        if reports[dataset] is None:
+            reply_with(
+                "aradığım kaynağı ya 5 gündür güncellemiyorlar ya da komple"
+                " uçurdular. umarım salgın sona erdiği içindir ve bağlantımda"
+                " bi sorun yoktur."
+            )
+            return
     
     logger.info("Got COVID database.")
     
     # TODO: Handle country or data type reading from .csv error as well.
     
-    case = 0
-    active = 0
-    recoveries = 0
-    deaths = 0
-    
-    location_data = df.loc[df["Country_Region"] == location]
+    paragraphs = []
+    mismatched = []
     
-    # Iterate for every location name match in the CSV. This enables the
-    #   summation of data released seperately for different states/provinces
-    #   (e.g US, Australia...).
-    for i in location_data.itertuples(index=False):
-        t_conf = i.Confirmed
-        t_actv = i.Active
-        t_recv = i.Recovered
-        t_dths = i.Deaths
+    for location in locations:
+        dataset = covid_dataset(location)
+        date, report = reports[dataset]
         
-        if pd.notnull(t_conf): case += t_conf
-        if pd.notnull(t_actv) and t_actv > 0: active += int(t_actv)
-        if pd.notnull(t_recv): recoveries += int(t_recv)
-        if pd.notnull(t_dths): deaths += t_dths
+        if location == CovidReport.TOP:
+            paragraphs.append(covid_ranking(dataset, date, report))
+            continue
         
-    logger.info(
-        f"Got case: {case}, active: {active}, recoveries: {recoveries},"
-        f" deaths: {deaths}"
-    )
-    
-    if location == "United Kingdom":
-        location_text = "birleşik krallık'ta"
-    else:
-        location_text = get_preposition(get_first_key(DICT_LOCATIONS, location))
-    
-    covidtext = datetime_format(msg_date - dt.timedelta(url_tries)) \
-        + f" itibariyle {location_text} toplam {case:,} resmi vaka olmuş." \
-        f"\nverilere göre bunlardan {active:,} tanesi aktif." \
-        f"\ngeri kalan kişilerin {deaths:,} tanesi hayatını kaybetmiş," \
-        f" {recoveries:,} tanesi iyileşmiş.\n"
-    
-    if not recoveries:
-        covidtext += "0 iyileşen kötüymüş be. ülkenin henüz tüm verileri" \
-            + " sunmuyor olma ihtimali yüksek.\n"
-    
-    covidtext += choose_one(LIST_CORONA)
-    
-    context.bot.send_message(chat_id, covidtext, isgroup=chat_is_group)
+        totals = report.get(location)
+        
+        paragraphs.append(
+            covid_summary(
+                location, date, totals,
+                covid_history.changes(dataset, location, date)
+            )
+        )
+        
+        # Sums of many countries hardly add up, as not all of them report
+        #   recoveries, so only the countries are checked:
+        if location in report.aggregates:
+            continue
+        
+        if totals.confirmed != (
+                totals.active + totals.deaths + totals.recovered):
+            mismatched.append(location)
     
-    if case != (active + deaths + recoveries):
-        logger.warning(f"COVID stats didn't add up for {location}.")
+    if mismatched:
+        logger.warning(f"COVID stats didn't add up for {mismatched}.")
         
         notify_admins(
             context,
-            f"{location} bölgesi için COVID vakaları tutarsız çıktı!"
+            f"{', '.join(mismatched)} bölgeleri için COVID vakaları tutarsız"
+            " çıktı!"
         )
         
-        context.bot.send_message(
-            chat_id,
-            f"bu arada farkettim de {get_first_key(DICT_LOCATIONS, location)}"
-            " sayıları tutmuyor. belki istisnai bir durum falan vardır. ya da"
-            " kaynak yamuktur. ya da dört işlem yapmayı beceremiyorumdur.",
-            isgroup=chat_is_group
+        names = ", ".join(LOCATION_INDEX.display_name(i) for i in mismatched)
+        paragraphs.append(
+            f"bu arada farkettim de {names} sayıları tutmuyor. belki istisnai"
+            " bir durum falan vardır. ya da kaynak yamuktur. ya da dört işlem"
+            " yapmayı beceremiyorumdur.\n"
         )
+    
+    covidtext = "\n".join(paragraphs) + choose_one(LIST_CORONA)
+    
+    # A single reply, split only if it exceeds the message length limit:
+    for i in split_message(covidtext):
+        context.bot.send_message(chat_id, i, isgroup=chat_is_group)
 
 
 # TODO: Handle Telegram exceptions better - see:
@@ -974,7 +4290,7 @@ def annc_subscription(update, context):
     if chat_id not in db_chats:
         # (This if block is not needed but checking anyway to avoid a redundant
         #   func. call:)
-        db_add(PATH_CHATS, db_chats, chat_id)
+        db_add(PATH_CHATS, db_chats, chat_id, update.effective_chat.type)
     
     if chat_id in db_annc_blist:
         db_remove(PATH_ANNC_BLIST, db_annc_blist, chat_id)
@@ -989,10 +4305,6 @@ def annc_subscription(update, context):
             "tamamdır, bu konuşmayı duyuru listesinden çıkardım. fikrinizi"
             " değiştirirseniz bu komutu tekrar çalıştırın."
         )
-        
-    # Manual backup of the updated chat data. Change if becomes too
-    #   overwhelming:
-    db_backup(update, context, called_with_message=False)
 
 
 def announce(update, context):
@@ -1012,10 +4324,16 @@ def announce(update, context):
         update.message.reply_text("yalnızca adminler duyuru yapabilir!")
         return
     
-    # Check if there is an ongoing process:
-    try:
-        state = dict_chat_states[chat_id]
-        
+    if last_broadcast is not None and last_broadcast.running:
+        update.message.reply_text(
+            "önceki duyuru hala gönderiliyor! bitince tekrar dene."
+        )
+        return
+    
+    # Start the announcement process unless there is an ongoing process:
+    state = dict_chat_states.set_new(chat_id, "announce_lv1")
+    
+    if state is not None:
         if state.startswith("announce"):
             update.message.reply_text(
                 "yarım kalan bir duyuru işi var! önce onu tamamla veya iptal"
@@ -1027,10 +4345,6 @@ def announce(update, context):
             )
         
         return
-    except KeyError:
-        pass
-    
-    dict_chat_states[chat_id] = "announce_lv1"
     
     update.message.reply_markdown_v2(
         "DİKKAT: bu mesajdan sonra gördüğüm ilk mesajı *bütün* bilinen"
@@ -1047,6 +4361,9 @@ def revoke_announcement(update, context):
     
     Only an administrator user can call this function. However, the chat need
     not be an admin. chat.
+    
+    The deletion is carried out by the revoke_job background job (see
+    revoke_messages).
     """
     
     # TODO: Should shorten redundant update member accesses
@@ -1055,7 +4372,11 @@ def revoke_announcement(update, context):
         update.message.reply_text("yalnızca adminler duyuruları silebilir!")
         return
     
-    global dict_last_anncs
+    if last_broadcast is not None and last_broadcast.running:
+        update.message.reply_text(
+            "duyuru hala gönderiliyor! silmek için gönderimin bitmesini bekle."
+        )
+        return
     
     logger.info("Starting deletion of latest announcement messages...")
     
@@ -1069,9 +4390,6 @@ def revoke_announcement(update, context):
         logger.info("Empty message list - Terminating deletion function.")
         
         return
-        
-    del_msg = context.bot.delete_message
-    all_deleted = True
     
     context.bot.send_message(
         update.effective_chat.id,
@@ -1079,48 +4397,135 @@ def revoke_announcement(update, context):
         isgroup=(update.effective_chat.type != "private")
     )
     
-    for chat_id in dict_last_anncs:
-        msg_id = dict_last_anncs[chat_id]
-        try:
-            if del_msg(chat_id, msg_id):
+    context.job_queue.run_once(
+        revoke_job,
+        0,
+        context=(update.effective_chat.id, dict(dict_last_anncs.items())),
+        name="revoke_announcement"
+    )
+    
+    if last_broadcast is not None:
+        last_broadcast.mark_revoked()
+    
+    # Empty the store, the job holds the messages to delete from now on:
+    dict_last_anncs.clear()
+    
+    logger.info(
+        "Emptied last announcements store. Exiting revoke_announcement."
+    )
+
+
+def revoke_job(context):
+    """Start deleting the messages of an announcement, as a background job.
+    
+    The job's context must be a tuple of the chat ID to report the result to
+    and a dict of the messages to delete (chat IDs as keys and message IDs as
+    values).
+    
+    The deletions are made by revoke_messages on a thread of their own, like
+    the sending of a Broadcast, as the job queue runs its jobs one by one and
+    waiting for the deletions would hold up the other jobs (e.g. db_sync).
+    """
+    
+    report_chat, targets = context.job.context
+    
+    Thread(
+        target=revoke_messages,
+        args=(context, report_chat, targets),
+        name="revoke",
+        daemon=True
+    ).start()
+
+
+def revoke_messages(context, report_chat, targets):
+    """Delete the messages in targets (chat IDs as keys and message IDs as
+    values) and report the result to report_chat. Blocks until done.
+    
+    The deletions go through the bot's OutboundScheduler with the broadcast
+    priority, behind the interactive replies. Deletions failing with a
+    transient error (flood control, time out or network error) are retried
+    with increasing delays. A single summary is sent to the reporting chat and
+    to the admin groups at the end.
+    """
+    
+    failed = dict()
+    # Seconds to wait before the next retry, set by each attempt:
+    delay = 1
+    
+    for attempt in range(REVOKE_TRIES):
+        if attempt:
+            logger.info(
+                f"Retrying deletion in {delay} sec.s for {len(targets)} chats."
+            )
+            sleep(delay)
+        
+        promises = [
+            (chat_id, msg_id, context.bot.delete_message(
+                chat_id, msg_id, priority=OutboundScheduler.BROADCAST
+            ))
+            for chat_id, msg_id in targets.items()
+        ]
+        
+        retry = dict()
+        delay = 2 ** attempt
+        
+        for chat_id, msg_id, promise in promises:
+            promise.done.wait()
+            exc = promise.exception
+            
+            if exc is None and promise.result():
                 logger.info(
                     f"Deleted message (ID {msg_id}) from chat {chat_id}."
                 )
+            elif (isinstance(exc, (RetryAfter, TimedOut))
+                  or type(exc) is NetworkError):
+                retry[chat_id] = msg_id
+                
+                if isinstance(exc, RetryAfter):
+                    delay = max(delay, exc.retry_after)
             else:
-                raise TelegramError
-        except TelegramError:
-            logger.warning(
-                f"Could not delete message (ID {msg_id}) from chat {chat_id}!"
-            )
-            
-            notify_admins(
-                context,
-                f"{msg_id} no.lu mesaj {chat_id} no.lu konuşmadan silinemedi!"
-            )
-            
-            all_deleted = False
+                logger.warning(
+                    f"Could not delete message (ID {msg_id}) from chat"
+                    f" {chat_id}!"
+                )
+                
+                failed[chat_id] = msg_id
+        
+        targets = retry
+        
+        if not targets:
+            break
+    else:
+        logger.warning(f"Giving up deleting from {len(targets)} chats.")
+        failed.update(targets)
     
     logger.info("Finished deletion of latest announcement messages.")
     
-    # Empty the dict
-    dict_last_anncs = dict()
-    
-    if all_deleted:
+    if not failed:
         context.bot.send_message(
-            update.effective_chat.id,
+            report_chat,
             "mesajlar tüm alıcılardan başarıyla silindi.",
-            isgroup=(update.effective_chat.type != "private")
+            isgroup=(report_chat < 0)
         )
     else:
         context.bot.send_message(
-            update.effective_chat.id,
+            report_chat,
             "mesajlar bir veya daha fazla alıcıdan başarıyla silinemedi. mesaj"
             " zaten alıcı tarafından silinmiş veya son duyurunun üzerinden"
             " silmeyi engelleyecek kadar uzun bir süre geçmiş olabilir.",
-            isgroup=(update.effective_chat.type != "private")
+            isgroup=(report_chat < 0)
+        )
+        
+        listed = ", ".join(
+            f"{chat_id} ({msg_id})"
+            for chat_id, msg_id in list(failed.items())[:50]
+        )
+        
+        notify_admins(
+            context,
+            f"duyuru {len(failed)} konuşmadan silinemedi. konuşma (mesaj)"
+            f" no.ları: {listed}" + (" ..." if len(failed) > 50 else "")
         )
-    
-    logger.info("Emptied last announcements dict. Exiting revoke_announcement.")
 
 
 def abort_state(update, context):
@@ -1137,19 +4542,15 @@ def abort_state(update, context):
         
         if state.startswith("announce"):
             if update.effective_user.id in DB_ADMIN_CHATS:
-                del dict_chat_states[chat_id]
-                
-                try:
-                    del dict_annc_temp[chat_id]
-                except KeyError:
-                    pass
+                dict_chat_states.pop(chat_id)
+                dict_annc_temp.pop(chat_id)
                 
                 reply_with("tamamdır, duyuru işlemini iptal ettim.")
             else:
                 reply_with("yalnızca adminler duyuru işlemini iptal edebilir!")
         else:
             # Should never execute - ensure all possible states are checked
-            del dict_chat_states[chat_id]
+            dict_chat_states.pop(chat_id)
             
             reply_with(
                 "benimle yürüttüğün bir işlem vardı ama ne olduğunu tam"
@@ -1167,27 +4568,25 @@ def abort_state(update, context):
         reply_with("iptal edilecek bir şey yok ki")
 
 
-def main():
-    """Starts the bot."""
+def restore_broadcast(bot):
+    """Restore the last announcement, and resume sending it with bot if it was
+    interrupted."""
     
-    # TODO: Handle network errors, see:
-    #   https://github.com/python-telegram-bot/python-telegram-bot/wiki/Handling-network-errors
-    # TODO: Multithreading can be implemented for performance. See:
-    #  https://github.com/python-telegram-bot/python-telegram-bot/wiki/Performance-Optimizations
-    
-    # Increase the connection pool size to 8 (Check telegram/ext/updater.py for
-    #   pool size requirements):
-    req = Request(con_pool_size=8)
-    # Set a limit of 29 messages per second (30 is the max. allowed, 29 should
-    #   ensure safety) for all chats, 19 per minute for groups (20 is maximum).:
-    msgq = mq.MessageQueue(all_burst_limit=29, group_burst_limit=19)
-    skiwobot = SanalkiwoBot(TOKEN, request=req, msg_queue=msgq)
-    updater = UpdaterBotStop(bot=skiwobot, use_context=True)
-    dp = updater.dispatcher
-    jobq = updater.job_queue
+    global last_broadcast
+    global dict_last_anncs
     
-    global BOT_ID
-    BOT_ID = skiwobot.id
+    last_broadcast = Broadcast.load(PATH_LAST_ANNC)
+    
+    if last_broadcast is not None:
+        dict_last_anncs = last_broadcast.delivered
+        
+        if not last_broadcast.done:
+            logger.info("Resuming the interrupted mass announcement.")
+            last_broadcast.start(bot)
+
+
+def add_handlers(dp):
+    """Register the update handlers of the bot to the dispatcher dp."""
     
     # On command messages: #
     dp.add_handler(CommandHandler({"start", "basla", "baslat"}, start))
@@ -1219,12 +4618,80 @@ def main():
     
     # Log all errors:
     dp.add_error_handler(error_log)
+
+
+def add_jobs(jobq):
+    """Schedule the background jobs of the bot on the job queue jobq."""
     
     # Clean leftover files once a day with db_cleanup func.:
     # TODO: JobQueue might benefit from a better implementation. see:
     #   https://github.com/python-telegram-bot/python-telegram-bot/wiki/Extensions-%E2%80%93-JobQueue
     jobq.run_repeating(db_cleanup, interval=dt.timedelta(days=1), first=0)
     
+    # Make sure the chat database changes reach the disk:
+    jobq.run_repeating(db_sync, interval=dt.timedelta(seconds=30))
+    
+    # Back up the chat database changes to the admin groups:
+    backup_scheduler.start(jobq)
+    
+    # Keep the chat states across restarts:
+    jobq.run_repeating(state_snapshot, interval=dt.timedelta(seconds=30))
+    
+    # Keep the newest COVID reports ready for corona:
+    jobq.run_repeating(
+        covid_prefetch, interval=dt.timedelta(hours=1), first=0
+    )
+    
+    # Log the share of the messages skipped by read_incoming:
+    jobq.run_repeating(filter_report, interval=dt.timedelta(hours=1))
+
+
+def main():
+    """Starts the bot."""
+    
+    # TODO: Handle network errors, see:
+    #   https://github.com/python-telegram-bot/python-telegram-bot/wiki/Handling-network-errors
+    
+    # Set a limit of 29 calls per second (30 is the max. allowed, 29 should
+    #   ensure safety) for all chats, 1 per second for private chats and 19 in
+    #   any minute for groups (20 is maximum), i.e. a burst of one call and 18
+    #   more in the next minute:
+    scheduler = OutboundScheduler(
+        rate=29, private_rate=1, group_rate=18 / 60, group_burst=1
+    )
+    # Increase the connection pool size to 8, plus one for every chat worker
+    #   and sender thread (Check telegram/ext/updater.py for pool size
+    #   requirements):
+    req = Request(con_pool_size=8 + DISPATCH_WORKERS + scheduler.senders)
+    skiwobot = SanalkiwoBot(TOKEN, request=req, scheduler=scheduler)
+    
+    if DISPATCH_WORKERS:
+        # Handle the updates of different chats concurrently:
+        jobq = JobQueue()
+        dp = OrderedDispatcher(
+            skiwobot,
+            Queue(),
+            job_queue=jobq,
+            use_context=True,
+            chat_workers=DISPATCH_WORKERS,
+            max_pending=DISPATCH_QUEUE_DEPTH
+        )
+        jobq.set_dispatcher(dp)
+        updater = UpdaterBotStop(dispatcher=dp, workers=None, use_context=True)
+    else:
+        updater = UpdaterBotStop(bot=skiwobot, use_context=True)
+        dp = updater.dispatcher
+        jobq = updater.job_queue
+    
+    global BOT_ID
+    BOT_ID = skiwobot.id
+    
+    restore_broadcast(skiwobot)
+    add_handlers(dp)
+    add_jobs(jobq)
+    
+    startup_timer.step("bot setup")
+    
     # Start the bot:
     if DEPLOYED:
         updater.start_webhook(
@@ -1237,16 +4704,64 @@ def main():
     else:
         updater.start_polling()
     
+    startup_timer.step("connection")
+    logger.info(startup_timer.report())
     logger.info("Waiting for input...")
     
     # Run the bot until the process receives SIGINT, SIGTERM or SIGABRT
     updater.idle()
 
+
+def main_async():
+    """Starts the bot on the asyncio runtime (see AsyncRuntime)."""
+    
+    if aiohttp is None:
+        raise ImportError("The asyncio runtime needs the aiohttp package.")
+    
+    skiwobot = AsyncBot(TOKEN, loop=asyncio.new_event_loop())
+    runtime = AsyncRuntime(skiwobot)
+    
+    global BOT_ID
+    BOT_ID = skiwobot.id
+    
+    restore_broadcast(skiwobot)
+    add_handlers(runtime.dispatcher)
+    add_jobs(runtime)
+    
+    startup_timer.step("bot setup")
+    logger.info(startup_timer.report())
+    
+    # Start the bot, run until the process receives SIGINT or SIGTERM:
+    if DEPLOYED:
+        runtime.run(
+            webhook_url="https://sanalkiwobot.herokuapp.com/" + TOKEN,
+            url_path=TOKEN,
+            port=PORT
+        )
+    else:
+        runtime.run()
+
 # TODO: Should the globals be defined inside the "if name == main" block?
 
 # Deduce if the program is run locally or is deployed (currently on Heroku):
 DEPLOYED = bool(os.environ.get("DEPLOYED", default=False))
 
+# Storage of the chat databases: "text" (ChatSetStore) or "sqlite"
+#   (ChatDatabase):
+CHAT_DB_BACKEND = os.environ.get("CHAT_DB", default="text")
+
+# The runtime to run the bot on: "threads" (Updater, see main) or "asyncio"
+#   (AsyncRuntime, see main_async):
+RUNTIME = os.environ.get("RUNTIME", default="threads")
+
+# Number of threads handling the updates of different chats concurrently (0
+#   handles every update on the dispatcher thread), and the maximum number of
+#   updates waiting for them:
+DISPATCH_WORKERS = int(os.environ.get("DISPATCH_WORKERS", default="8"))
+DISPATCH_QUEUE_DEPTH = int(
+    os.environ.get("DISPATCH_QUEUE_DEPTH", default="256")
+)
+
 # Enable logging:
 # IDEA: May keep the logs in a file with level logging.DEBUG
 logging.basicConfig(
@@ -1256,6 +4771,9 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Times of the startup steps, logged once the bot is ready:
+startup_timer = StartupTimer()
+
 
 ## Strings ##
 
@@ -1271,20 +4789,54 @@ PATH_TL_DIR = "resources/text_lists/"
 # Message text lists:
 PATH_ML_DIR = "resources/msg_texts/"
 
+# Announcement data:
+PATH_ANNC_DATA_DIR = "resources/annc_data/"
+
+# Snapshots of the chat states (see ChatStateStore class):
+PATH_STATE_DIR = "resources/state_data/"
+
 PATH_CHATS = PATH_CHAT_DATA_DIR + "chats.txt"
 PATH_ADMIN_CHATS = PATH_CHAT_DATA_DIR + "admin_chats.txt"
 
 # Announcement Blacklist path for those who don't want to be announced:
 PATH_ANNC_BLIST = PATH_CHAT_DATA_DIR + "annc_blist.txt"
 
+# SQLite chat registry, used instead of the two files above if the CHAT_DB
+#   environment variable is "sqlite". The files are migrated into it on its
+#   first use:
+PATH_CHAT_DB = PATH_CHAT_DATA_DIR + "chats.db"
+
+# Delivery journal of the last announcement (see Broadcast class):
+PATH_LAST_ANNC = PATH_ANNC_DATA_DIR + "last_annc.jsonl"
+
+PATH_CHAT_STATES = PATH_STATE_DIR + "chat_states.json"
+PATH_ANNC_TEMP = PATH_STATE_DIR + "annc_temp.json"
+
 PATH_TOKEN = "resources/.token.txt"
 
+# Values built from the text lists and message texts, see StartupSnapshot.
+#   (Not in PATH_CACHE_DIR, as db_cleanup empties it.)
+PATH_STARTUP_SNAPSHOT = PATH_STATE_DIR + "startup.pickle"
+
+# The snapshot of the values of the resource files, read in here and used by
+#   the globals below which are built from the resource files. (TOKEN and the
+#   chat data are never put in it.)
+startup = StartupSnapshot(
+    PATH_STARTUP_SNAPSHOT,
+    [__file__] + [
+        d + i for d in (PATH_TL_DIR, PATH_ML_DIR) for i in sorted(os.listdir(d))
+    ]
+).load()
+
 # Token constant:
 if DEPLOYED:
     TOKEN = os.environ.get("TOKEN")
 else:
     TOKEN = db_read(PATH_TOKEN, str)
 
+# Number of tries for deleting an announcement message (see revoke_messages):
+REVOKE_TRIES = 4
+
 # Bot ID variable to use in identity checks, initialized in main
 BOT_ID = 0
 
@@ -1292,9 +4844,25 @@ BOT_ID = 0
 if DEPLOYED:
     PORT = int(os.environ.get("PORT", "8443"))
 
-# Last succesful COVID data retrieval date. Initial value is a date guaranteed
-#   to compare old enough to re-retrieve (update) a file.
-last_covid_get_date = dt.datetime.now() - dt.timedelta(hours=8)
+# Local copies of the COVID reports. The source URL can be overridden for
+#   testing against a local server:
+covid_fetcher = CovidFetcher(
+    PATH_COVID_DIR,
+    base_url=os.environ.get("COVID_DATA_URL", CovidFetcher.BASE_URL)
+)
+
+# Countries of the regions which corona can report the totals of (e.g.
+#   "Europe"), see CovidReport:
+COVID_REGIONS = startup.get("COVID_REGIONS", lambda: {
+    k: v.split("; ")
+    for k, v in db_read(PATH_TL_DIR + "dict_region_countries.txt", dict).items()
+})
+
+# Totals of the COVID reports of the past days, see CovidHistory:
+covid_history = CovidHistory(PATH_COVID_DIR + "history.npz")
+
+# Parsed COVID reports, shared by every corona call:
+covid_reports = CovidReportCache(regions=COVID_REGIONS, history=covid_history)
 
 
 # IDEA: Use below if stickers are implemented. For sticker & media replies, see:
@@ -1311,76 +4879,211 @@ last_covid_get_date = dt.datetime.now() - dt.timedelta(hours=8)
 DB_ADMIN_CHATS = db_read(PATH_ADMIN_CHATS, read_int=True)
 
 # Sets of chat ID databases: #
+#   (Kept up to date with db_add and db_remove, through the storage of each
+#   file.)
+
+if CHAT_DB_BACKEND == "sqlite":
+    chat_db = ChatDatabase(PATH_CHAT_DB)
+    chat_db.migrate(PATH_CHATS, PATH_ANNC_BLIST)
+    
+    chat_stores = {
+        PATH_CHATS: ChatDatabaseSet(chat_db),
+        PATH_ANNC_BLIST: ChatDatabaseSet(chat_db, blist=True)
+    }
+else:
+    chat_db = None
+    
+    chat_stores = {
+        PATH_CHATS: ChatSetStore(PATH_CHATS),
+        PATH_ANNC_BLIST: ChatSetStore(PATH_ANNC_BLIST)
+    }
+
+db_chats = chat_stores[PATH_CHATS].load()
+db_annc_blist = chat_stores[PATH_ANNC_BLIST].load()
+
+# Backups of the changes in the sets above, the seconds to wait for more
+#   changes before a backup can be set with the BACKUP_WINDOW environment
+#   variable:
+backup_scheduler = BackupScheduler(
+    window=dt.timedelta(seconds=int(os.environ.get("BACKUP_WINDOW", "300")))
+)
+
+# zlib compression level (0-9) of the backup archives:
+BACKUP_COMPRESSLEVEL = int(os.environ.get("BACKUP_COMPRESSLEVEL", "6"))
 
-db_chats = db_read(PATH_CHATS, read_int=True)
-db_annc_blist = db_read(PATH_ANNC_BLIST, read_int=True)
+# SHA-256 hash of the chat data contents in the last archive sent:
+last_archive_hash = None
+
+# Letters of the Turkish alphabet by how they affect the suffixes, see
+#   get_preposition and TurkishStemmer:
+BACK_VOWELS = {"a", "ı", "o", "u"}
+FRONT_VOWELS = {"e", "i", "ö", "ü"}
+VOWELS = BACK_VOWELS | FRONT_VOWELS
+HARD_CONSONANTS = {"f", "s", "t", "k", "ç", "ş", "h", "p"}
 
 # Sets of few basic Turkish and English words: #
 #   "ws" prefix of the variables stand for "word set".
-# TODO: Add better suffix detection, maybe through another function? remove the
-#   suffixed versions of words from the sets when implemented
+#   (The suffixed versions of the words are not needed, the words of the
+#   messages are stemmed by STEMMER before they are looked up. WS_REQUEST is
+#   the exception, see build_stemmer.)
 
-WS_GREET = db_read(PATH_TL_DIR + "ws_greet.txt")
-WS_WHATSUP = db_read(PATH_TL_DIR + "ws_whatsup.txt")
+WS_GREET = startup.get(
+    "WS_GREET", lambda: db_read(PATH_TL_DIR + "ws_greet.txt")
+)
+WS_WHATSUP = startup.get(
+    "WS_WHATSUP", lambda: db_read(PATH_TL_DIR + "ws_whatsup.txt")
+)
 
 # Words indicating a message targeted at a group:
-WS_GROUP = db_read(PATH_TL_DIR + "ws_group.txt")
+WS_GROUP = startup.get(
+    "WS_GROUP", lambda: db_read(PATH_TL_DIR + "ws_group.txt")
+)
 
 # Words indicating a message targeted at the bot, doesn't include "kıvanç" and
 #   "kivanc" intentionally:
-WS_KIWO = db_read(PATH_TL_DIR + "ws_kiwo.txt")
+WS_KIWO = startup.get("WS_KIWO", lambda: db_read(PATH_TL_DIR + "ws_kiwo.txt"))
 
 # Word list for /corona:
-WS_CORONA = db_read(PATH_TL_DIR + "ws_corona.txt")
+WS_CORONA = startup.get(
+    "WS_CORONA", lambda: db_read(PATH_TL_DIR + "ws_corona.txt")
+)
+
+# Phrases asking /corona for the countries with the most cases (see
+#   covid_ranking):
+WS_RANKING = startup.get(
+    "WS_RANKING", lambda: db_read(PATH_TL_DIR + "ws_ranking.txt")
+)
 
 # Words that may indicate a request:
-WS_REQUEST = db_read(PATH_TL_DIR + "ws_request.txt")
+WS_REQUEST = startup.get(
+    "WS_REQUEST", lambda: db_read(PATH_TL_DIR + "ws_request.txt")
+)
+
+# Words which look like a suffixed keyword but are not (e.g. "maliye"), kept
+#   as they are by STEMMER:
+WS_NOSTEM = startup.get(
+    "WS_NOSTEM", lambda: db_read(PATH_TL_DIR + "ws_nostem.txt")
+)
 
 
 ## Dict.s ##
 
+# Patterns of normalise: #
+#   (Compiled once here, as str.translate and long character classes turned
+#   out to be the slowest parts of reducing a message.)
+
+# Matches any punctuation:
+PUNCTUATION_PATTERN = re.compile(char_class(string.punctuation))
+
+# Every emoji known by the emoji package (the English ones, in newer versions
+#   where they are grouped by language):
+EMOJIS = startup.get(
+    "EMOJIS", lambda: set(emoji.UNICODE_EMOJI.get("en", emoji.UNICODE_EMOJI))
+)
+
+# Lengths of the emojis starting with each character, the longest first:
+EMOJI_LENGTHS = startup.get("EMOJI_LENGTHS", lambda: emoji_lengths(EMOJIS))
+
+# Matches the first characters of the emojis, and some other characters around
+#   them which are checked against EMOJIS afterwards. (The Turkish letters are
+#   not matched.)
+EMOJI_START = startup.get(
+    "EMOJI_START",
+    lambda: re.compile(char_class({i[0] for i in EMOJIS}, gap=16))
+)
+
 # Turkish location names with correspondents in COVID datasheet
 # The most preferred Turkish name must be the top one if multiple ones exist!
-# (get_first_key is used when choosing the Turkish name to use in a reply. see
+# (LocationIndex uses the first one as the Turkish name to use in a reply. see
 #   corona function.)
 # TODO: Add Taiwan
-DICT_LOCATIONS = db_read(PATH_TL_DIR + "dict_locations.txt", dict)
+DICT_LOCATIONS = startup.get(
+    "DICT_LOCATIONS", lambda: db_read(PATH_TL_DIR + "dict_locations.txt", dict)
+)
+
+# Turkish names of the regions and other aggregates of the COVID reports (e.g.
+#   "avrupa", "dünya"), used as location names as well:
+DICT_REGIONS = startup.get(
+    "DICT_REGIONS", lambda: db_read(PATH_TL_DIR + "dict_regions.txt", dict)
+)
+
+# Index of every accepted form of the location names above:
+LOCATION_INDEX = startup.get(
+    "LOCATION_INDEX", lambda: LocationIndex({**DICT_LOCATIONS, **DICT_REGIONS})
+)
+
+# Matcher for every phrase of the word sets and location names above, used for
+#   keyword recognition in read_incoming:
+KEYWORD_MATCHER = startup.get("KEYWORD_MATCHER", build_keyword_matcher)
+
+# Stemmer of the words of the incoming messages, to the words of the phrases
+#   above:
+STEMMER = startup.get("STEMMER", build_stemmer)
+
+# Words which can get a message in a group replied to, see read_incoming. (The
+#   last ones are the keywords of its "Not targeted_to_bot" block.)
+MESSAGE_FILTER = MessageFilter(
+    WS_KIWO | WS_GROUP | {"selamlar", "merhabalar", "nabersiniz"}, STEMMER
+)
+
+# Time after which an unfinished interactive process of a chat is forgotten:
+STATE_TTL = dt.timedelta(hours=1)
 
 # Chat states: If a chat is in an interactive process requiring more than one
 #   interaction with the bot, holds a string representing the process with the
 #   chat ID as the key. When the chat sends a message, read_incoming will behave
 #   according to the chat's state.
-# (Not backing up the data in a file as the states usually last less than a
-#   minute or so.)
-dict_chat_states = dict()
+# (Snapshotted periodically by state_snapshot, so that a restart does not
+#   interrupt the process.)
+dict_chat_states = ChatStateStore(ttl=STATE_TTL, path=PATH_CHAT_STATES).load()
 
 # Copies of the last sent announcement: Keys are chat IDs and values are message
-#   IDs. Kept for the possibility of the need for deletion. No database file
-#   correspondent exists.
-dict_last_anncs = dict()
+#   IDs. Kept for the possibility of the need for deletion. Filled by the
+#   Broadcast of the announcement, restored from its journal on startup.
+dict_last_anncs = ChatStateStore(ttl=Broadcast.DELETE_WINDOW)
+
+# The Broadcast of the last announcement, initialized in main:
+last_broadcast = None
 
 # Temporary buffer for announcement message: Keys are chat IDs and values are
 #   the announcement messages.
-dict_annc_temp = dict()
+dict_annc_temp = ChatStateStore(ttl=STATE_TTL, path=PATH_ANNC_TEMP).load()
+
+# Chat actions sent by send_action, keyed by (chat ID, action) tuples. A chat
+#   action is shown for 5 seconds (or until the bot sends a message):
+recent_actions = ChatStateStore(ttl=dt.timedelta(seconds=5))
 
 
 ## String lists to choose one from ##
 
 # "What's up?" replies:
-LIST_WHATSUP_REPLY = db_read(PATH_TL_DIR + "list_whatsup_reply.txt", list)
+LIST_WHATSUP_REPLY = startup.get(
+    "LIST_WHATSUP_REPLY",
+    lambda: db_read(PATH_TL_DIR + "list_whatsup_reply.txt", list)
+)
 
 # /corona bonus end-text replies:
-LIST_CORONA = db_read(PATH_TL_DIR + "list_corona.txt", list)
+LIST_CORONA = startup.get(
+    "LIST_CORONA", lambda: db_read(PATH_TL_DIR + "list_corona.txt", list)
+)
 
 
 ## Message strings (for some specific replies) ##
 
-with open(PATH_ML_DIR + "msg_start.txt") as fl:
-    MSG_START = fl.read()
+MSG_START = startup.get(
+    "MSG_START", lambda: msg_read(PATH_ML_DIR + "msg_start.txt")
+)
+MSG_HELP = startup.get(
+    "MSG_HELP", lambda: msg_read(PATH_ML_DIR + "msg_help.txt")
+)
 
-with open(PATH_ML_DIR + "msg_help.txt") as fl:
-    MSG_HELP = fl.read()
+# Write the snapshot if any of the values above had to be built:
+startup.save()
+startup_timer.step("resources (snapshot)" if startup.loaded else "resources")
 
 
 if __name__ == '__main__':
-    main()
+    if RUNTIME == "asyncio":
+        main_async()
+    else:
+        main()
@@ -0,0 +1,59 @@
+"""Regression tests of TurkishStemmer with the keyword vocabulary of the bot.
+
+Run from the repository root with:
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+# The resource paths of the bot are relative to the repository root:
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+import sanalkiwobot as skb
+
+
+def labels(text):
+    """Return the keyword labels found in a message text."""
+    
+    words = skb.STEMMER.stem_all(skb.normalise(text).candidates)
+    
+    return skb.KEYWORD_MATCHER.scan(words).labels
+
+
+class TestTurkishStemmer(unittest.TestCase):
+    
+    def test_suffixed_keywords(self):
+        for word, stem in [
+            ("selamlar", "selam"), ("merhabalar", "merhaba"),
+            ("kiwocum", "kiwo"), ("covide", "covid"), ("koronaya", "korona"),
+            ("virüsten", "virüs"), ("nabersiniz", "naber"),
+            ("türkiyedeki", "türkiyede")
+        ]:
+            self.assertEqual(skb.STEMMER.stem(word), stem, word)
+    
+    def test_no_short_stems(self):
+        # Words ending like a short keyword (e.g. "sa", "at", "ne", "çad"):
+        for word in ["sayısı", "atlar", "ata", "atarsın", "neden", "nedir",
+                     "sana", "çadırda"]:
+            self.assertEqual(skb.STEMMER.stem(word), word)
+    
+    def test_nostem_words(self):
+        self.assertEqual(skb.STEMMER.stem("maliye"), "maliye")
+        self.assertEqual(skb.STEMMER.stem("maliyeye"), "maliye")
+    
+    def test_no_false_keywords(self):
+        found = labels("kiwo türkiyedeki vaka sayısı kaç")
+        
+        self.assertIn("location", found)
+        self.assertNotIn("greet", found)
+        
+        self.assertNotIn("location", labels("maliyeye bakalım"))
+        self.assertNotIn("request", labels("atlar koşuyor"))
+
+
+if __name__ == "__main__":
+    unittest.main()